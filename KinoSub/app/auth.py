@@ -1,8 +1,11 @@
-from fastapi import Depends, HTTPException, status
+from typing import Optional
+
+from fastapi import Depends, HTTPException, Query, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
-from app.database import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_async_db
 from app.models import User
+from app.services.identity_cache import CachedUser, identity_cache
 from jose import jwt, JWTError  # или другой способ
 from fastapi import APIRouter
 
@@ -10,12 +13,27 @@ router = APIRouter()
 
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/token")
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/token", auto_error=False)
 
 
 SECRET_KEY = "your-secret-key"  # замени на свой
 ALGORITHM = "HS256"
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> User:
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)) -> CachedUser:
+    return await authenticate(token, db)
+
+
+async def get_stream_user(
+    header_token: Optional[str] = Depends(optional_oauth2_scheme),
+    token: Optional[str] = Query(None, description="Токен для EventSource, который не умеет передавать заголовки"),
+    db: AsyncSession = Depends(get_async_db)
+) -> CachedUser:
+    if not (header_token or token):
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    return await authenticate(header_token or token, db)
+
+
+async def authenticate(token: str, db: AsyncSession) -> CachedUser:
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id: int = int(payload.get("sub"))
@@ -24,20 +42,28 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
-    user = db.query(User).filter(User.id == user_id).first()
+    # Горячий путь: пользователь уже в кэше, в БД не ходим
+    cached = identity_cache.get(user_id)
+    if cached is not None:
+        return cached
+
+    generation = identity_cache.generation
+    user = await db.get(User, user_id)
     if user is None:
         raise HTTPException(status_code=401, detail="User not found")
 
-    return user
+    cached = CachedUser.from_model(user)
+    identity_cache.set(cached, generation)
+    return cached
 
 
 
-def get_current_admin_user(current_user: User = Depends(get_current_user)):
+def get_current_admin_user(current_user: CachedUser = Depends(get_current_user)):
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Только для администраторов")
     return current_user
 
-def get_admin_user(current_user: User = Depends(get_current_user)) -> User:
+def get_admin_user(current_user: CachedUser = Depends(get_current_user)) -> CachedUser:
     if current_user.role != "admin":
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
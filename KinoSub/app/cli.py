@@ -0,0 +1,121 @@
+"""
+Консольные команды для фоновых задач:
+
+    python -m app.cli renew --workers 4
+    python -m app.cli check-indexes
+    python -m app.cli ingest-payments settlement.csv
+    python -m app.cli archive-notifications
+    python -m app.cli export payments --format csv --gzip -o payments.csv.gz
+"""
+import argparse
+import json
+import logging
+import sys
+
+
+def renew(args) -> None:
+    from app.services.background import run_parallel_renewal
+
+    stats = run_parallel_renewal(workers=args.workers, chunk_size=args.chunk_size)
+    print(json.dumps(stats, ensure_ascii=False, indent=2))
+
+
+def check_indexes(args) -> None:
+    from app.services.index_check import check_indexes
+
+    results = check_indexes(allow_seqscan=args.allow_seqscan)
+    for result in results:
+        mark = "OK  " if result["ok"] else "FAIL"
+        print(f"{mark} {result['query']} [{result['table']}]: {', '.join(result['scans']) or '-'}")
+    if not all(result["ok"] for result in results):
+        raise SystemExit(1)
+
+
+def ingest_payments(args) -> None:
+    import asyncio
+
+    from app.database import async_engine
+    from app.services.payment_ingest import ingest_payments
+
+    fmt = args.format or ("csv" if args.file.endswith(".csv") else "ndjson")
+
+    async def run():
+        lines = sys.stdin if args.file == "-" else open(args.file, encoding="utf-8-sig", newline="")
+        try:
+            async for result in ingest_payments(lines, fmt, batch_size=args.batch_size):
+                print(json.dumps(result, ensure_ascii=False))
+        finally:
+            lines.close()
+            await async_engine.dispose()
+
+    asyncio.run(run())
+
+
+def archive_notifications(args) -> None:
+    from app.services.notification_archive import archive_notifications
+
+    stats = archive_notifications(chunk_size=args.chunk_size)
+    print(json.dumps(stats, ensure_ascii=False, indent=2))
+
+
+def export(args) -> None:
+    from datetime import date
+
+    from app.services.export import export_query, stream_export
+
+    query = export_query(
+        args.name,
+        date_from=date.fromisoformat(args.date_from) if args.date_from else None,
+        date_to=date.fromisoformat(args.date_to) if args.date_to else None,
+        user_id=args.user_id,
+    )
+    output = sys.stdout.buffer if args.output == "-" else open(args.output, "wb")
+    try:
+        for chunk in stream_export(query, args.format, gzip=args.gzip, batch_size=args.batch_size):
+            output.write(chunk)
+    finally:
+        if output is not sys.stdout.buffer:
+            output.close()
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.cli")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    renew_parser = commands.add_parser("renew", help="Автопродление подписок")
+    renew_parser.add_argument("--workers", type=int, default=None, help="Число процессов-шардов")
+    renew_parser.add_argument("--chunk-size", type=int, default=None, help="Размер пачки")
+    renew_parser.set_defaults(handler=renew)
+
+    index_parser = commands.add_parser("check-indexes", help="Проверить через EXPLAIN, что горячие запросы идут по индексам")
+    index_parser.add_argument("--allow-seqscan", action="store_true", help="Не отключать seq scan (реальный план)")
+    index_parser.set_defaults(handler=check_indexes)
+
+    ingest_parser = commands.add_parser("ingest-payments", help="Загрузить файл расчётов (NDJSON или CSV)")
+    ingest_parser.add_argument("file", help="Путь к файлу, - для stdin")
+    ingest_parser.add_argument("--format", choices=["ndjson", "csv"], default=None, help="По умолчанию — по расширению файла")
+    ingest_parser.add_argument("--batch-size", type=int, default=None, help="Размер пачки")
+    ingest_parser.set_defaults(handler=ingest_payments)
+
+    archive_parser = commands.add_parser("archive-notifications", help="Перенести старые уведомления в архив")
+    archive_parser.add_argument("--chunk-size", type=int, default=None, help="Размер пачки")
+    archive_parser.set_defaults(handler=archive_notifications)
+
+    export_parser = commands.add_parser("export", help="Выгрузить платежи или операции по балансу")
+    export_parser.add_argument("name", choices=["payments", "balance-transactions"])
+    export_parser.add_argument("--format", choices=["csv", "ndjson"], default="csv")
+    export_parser.add_argument("--gzip", action="store_true", help="Сжать gzip")
+    export_parser.add_argument("-o", "--output", default="-", help="Файл, по умолчанию stdout")
+    export_parser.add_argument("--date-from", default=None, help="YYYY-MM-DD")
+    export_parser.add_argument("--date-to", default=None, help="YYYY-MM-DD, включительно")
+    export_parser.add_argument("--user-id", type=int, default=None)
+    export_parser.add_argument("--batch-size", type=int, default=None, help="Строк в пачке")
+    export_parser.set_defaults(handler=export)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,72 @@
+import time
+
 from sqlalchemy import create_engine #создает подключение к бд
 from sqlalchemy.orm import sessionmaker #создает новые сессии, основной способ взаимодействия с бд в орм режиме
-from app.config import DATABASE_URL #наш url, через который осуществляется подключение к бд
+from app.config import settings #настройки, в т.ч. url, через который осуществляется подключение к бд
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+
+from app.services.metrics import metrics
 
 Base = declarative_base()
 
-engine = create_engine(DATABASE_URL) #подключаемся к бд
+
+class _InstrumentedPoolMixin:
+    """Замеряет время ожидания свободного соединения в пуле"""
+    metrics_prefix = "db.pool"
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            metrics.inc(f"{self.metrics_prefix}.timeouts")
+            raise
+        finally:
+            metrics.observe(f"{self.metrics_prefix}.checkout_wait", time.perf_counter() - started)
+
+
+class InstrumentedQueuePool(_InstrumentedPoolMixin, QueuePool):
+    metrics_prefix = "db.pool.sync"
+
+
+class InstrumentedAsyncQueuePool(_InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    metrics_prefix = "db.pool.async"
+
+
+def _pool_options() -> dict:
+    return {
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout,
+        "pool_pre_ping": settings.db_pool_pre_ping,
+        "pool_recycle": settings.db_pool_recycle,
+    }
+
+
+DATABASE_URL = make_url(settings.database_url)
+
+sync_connect_args = {}
+if settings.db_statement_timeout_ms:
+    sync_connect_args["options"] = f"-c statement_timeout={settings.db_statement_timeout_ms}"
+
+sync_engine_options = {}
+if DATABASE_URL.get_driver_name() == "psycopg2":
+    # executemany для bulk insert/update пачками, а не построчно
+    sync_engine_options["executemany_mode"] = settings.db_executemany_mode
+    sync_engine_options["executemany_batch_page_size"] = settings.db_executemany_page_size
+
+engine = create_engine( #подключаемся к бд
+    DATABASE_URL,
+    poolclass=InstrumentedQueuePool,
+    connect_args=sync_connect_args,
+    insertmanyvalues_page_size=settings.db_executemany_page_size,
+    **sync_engine_options,
+    **_pool_options(),
+)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine) #создаем фабрику сессий (генератор сессий для запросов)
 
@@ -17,3 +78,39 @@ def get_db(): #создаем сессию, затем передаем упра
 
     finally:
         db.close()
+
+
+# Асинхронный движок (asyncpg) для async-обработчиков: запросы не блокируют event loop
+ASYNC_DATABASE_URL = DATABASE_URL.set(drivername="postgresql+asyncpg")
+
+async_connect_args = {}
+if settings.db_statement_timeout_ms:
+    async_connect_args["server_settings"] = {"statement_timeout": str(settings.db_statement_timeout_ms)}
+
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    poolclass=InstrumentedAsyncQueuePool,
+    connect_args=async_connect_args,
+    insertmanyvalues_page_size=settings.db_executemany_page_size,
+    **_pool_options(),
+)
+
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+async def get_async_db(): #то же, что get_db, но для AsyncSession
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def pool_stats() -> dict:
+    """Заполненность пулов: сколько соединений занято из максимально возможных"""
+    stats = {}
+    capacity = settings.db_pool_size + settings.db_max_overflow
+    for name, pool in (("sync", engine.pool), ("async", async_engine.sync_engine.pool)):
+        checked_out = pool.checkedout()
+        stats[f"db.pool.{name}.checked_out"] = checked_out
+        stats[f"db.pool.{name}.saturation"] = checked_out / capacity if capacity else 0.0
+    return stats
+
+
+metrics.register_collector(pool_stats)
@@ -1,12 +1,42 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, Request
 from fastapi.responses import HTMLResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 
-from app.routers import auth, users, subscriptions, wallet, payments, user_subscriptions, subscription_requests, notifications, debug_admin
+from app.routers import auth, users, subscriptions, wallet, payments, user_subscriptions, subscription_requests, notifications, debug_admin, exports, metrics
+from app.config import settings
+from app.database import async_engine, engine
+from app.services import background, passwords
+from app.services.catalog_cache import CHANNEL as CATALOG_CHANNEL, catalog_cache
+from app.services.notification_hub import notification_hub
+from app.services.payment_gateway import close_gateway
+from app.services.query_budget import install_query_budget
+from app.services.scheduler import scheduler
 import os
 
-app = FastAPI()
+background.register_jobs(scheduler)
+notification_hub.listen(CATALOG_CHANNEL, catalog_cache.on_notify)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if settings.scheduler_enabled:
+        await scheduler.start()
+    if settings.notification_stream_enabled:
+        await notification_hub.start()
+    yield
+    await notification_hub.stop()
+    await scheduler.stop()
+    passwords.shutdown()
+    await close_gateway()
+    await async_engine.dispose()
+    engine.dispose()
+
+
+app = FastAPI(lifespan=lifespan)
+install_query_budget(app, [engine, async_engine.sync_engine])
 
 app.include_router(auth.router)
 app.include_router(users.router)
@@ -17,6 +47,8 @@ app.include_router(user_subscriptions.router)
 app.include_router(subscription_requests.router)
 app.include_router(notifications.router)
 app.include_router(debug_admin.router)
+app.include_router(exports.router)
+app.include_router(metrics.router)
 
 # Подключение статики и шаблонов
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
@@ -1,8 +1,9 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Numeric, Text, Date, ForeignKey
+from sqlalchemy import BigInteger, Column, Integer, String, Boolean, DateTime, Numeric, Text, Date, ForeignKey, Index, UniqueConstraint, text
 from sqlalchemy.orm import relationship
 from app.database import Base
 from datetime import datetime, date
 from sqlalchemy import Enum as PgEnum
+from sqlalchemy.dialects.postgresql import JSONB
 import enum
 
 
@@ -36,9 +37,30 @@ class Subscription(Base):
     users = relationship("UserSubscription", back_populates="subscription")
 
 
+class CatalogVersion(Base):
+    """
+    Версия каталога подписок — одна строка (id = 1). Растёт в той же
+    транзакции, что и изменение каталога (см. services/catalog_cache.py)
+    """
+    __tablename__ = "catalog_version"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    version = Column(BigInteger, nullable=False, default=0)
+
+
 
 class UserSubscription(Base):
     __tablename__ = "user_subscriptions"
+    __table_args__ = (
+        # у пользователя не может быть двух записей об одной подписке
+        UniqueConstraint("user_id", "subscription_id", name="uq_user_subscriptions_user_subscription"),
+        # автопродление: auto_renew AND is_active AND end_date <= :today
+        Index("ix_user_subscriptions_renewal_due", "end_date", "id",
+              postgresql_where=text("auto_renew AND is_active")),
+        # отключение истёкших: is_active AND end_date < :today
+        Index("ix_user_subscriptions_active_end_date", "end_date",
+              postgresql_where=text("is_active")),
+    )
 
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -47,6 +69,7 @@ class UserSubscription(Base):
     end_date = Column(Date)                         # Дата окончания
     is_active = Column(Boolean, default=True)       # Активна ли подписка
     auto_renew = Column(Boolean, default=False)     # Автопродление
+    last_renewal_attempt = Column(Date, nullable=True)  # день последней попытки автопродления
 
     # Связи с таблицами (опционально, для удобства)
     user = relationship("User", back_populates="subscriptions")
@@ -56,6 +79,13 @@ class UserSubscription(Base):
 
 class Payment(Base):
     __tablename__ = "payments"
+    __table_args__ = (
+        Index("ix_payments_user_created", "user_id", "created_at", "id"),
+        # повторная загрузка файла расчётов не создаёт дублей
+        Index("uq_payments_external_id", "external_id", unique=True),
+        # сверка зависших платежей с провайдером
+        Index("ix_payments_pending", "created_at", postgresql_where=text("status = 'pending'")),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
@@ -63,8 +93,9 @@ class Payment(Base):
     amount = Column(Numeric(10, 2))
     status = Column(String(20))
     payment_method = Column(String(20))
-    external_id = Column(String(100))
-    created_at = Column(DateTime, default=datetime.utcnow)
+    external_id = Column(String(100))  # наша ссылка — ключ идемпотентности у провайдера
+    provider_transaction_id = Column(String(100), nullable=True)  # id операции у провайдера
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     is_refunded = Column(Boolean, default=False)
     refund_reason = Column(Text, nullable=True)
 
@@ -72,16 +103,38 @@ class Payment(Base):
 
 class Notification(Base):
     __tablename__ = "notifications"
+    __table_args__ = (
+        Index("ix_notifications_user_created", "user_id", "created_at", "id"),
+        # очистка старых прочитанных уведомлений
+        Index("ix_notifications_read_created", "created_at", postgresql_where=text("is_read")),
+        # счётчик непрочитанных и «прочитать всё до момента» — только непрочитанные строки
+        Index("ix_notifications_user_unread", "user_id", "created_at", postgresql_where=text("is_read = false")),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     message = Column(String, nullable=False)
     is_read = Column(Boolean, default=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
 
     user = relationship("User", back_populates="notifications")
 
 
+class NotificationArchive(Base):
+    """Уведомления, перенесённые из notifications по политике хранения (id сохраняется)"""
+    __tablename__ = "notifications_archive"
+    __table_args__ = (
+        Index("ix_notifications_archive_user_created", "user_id", "created_at"),
+        Index("ix_notifications_archive_archived", "archived_at"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    user_id = Column(Integer, nullable=True)  # как в notifications: NULL не должен ронять перенос
+    message = Column(String, nullable=False)
+    created_at = Column(DateTime, nullable=False)
+    archived_at = Column(DateTime, server_default=text("(now() at time zone 'utc')"), nullable=False)
+
+
 
 class TransactionType(enum.Enum):
     topup = "topup"
@@ -89,27 +142,88 @@ class TransactionType(enum.Enum):
 
 class BalanceTransaction(Base):
     __tablename__ = "balance_transactions"
+    __table_args__ = (
+        Index("ix_balance_transactions_user_created", "user_id", "created_at", "id"),
+    )
 
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     amount = Column(Numeric(10, 2), nullable=False)
     type = Column(PgEnum(TransactionType), nullable=False)
     description = Column(Text, nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
 
     user = relationship("User")
 
 
 class SubscriptionRequest(Base):
     __tablename__ = "subscription_requests"
+    __table_args__ = (
+        Index("ix_subscription_requests_user_subscription_status", "user_id", "subscription_id", "status"),
+        # не больше одной ожидающей заявки на одну подписку
+        Index("uq_subscription_requests_pending", "user_id", "subscription_id",
+              unique=True, postgresql_where=text("status = 'pending'")),
+        # очередь админа: ожидающие заявки от старых к новым
+        Index("ix_subscription_requests_pending_queue", "created_at", "id",
+              postgresql_where=text("status = 'pending'")),
+        # история обработанных заявок по статусу
+        Index("ix_subscription_requests_status_created", "status", "created_at", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     subscription_id = Column(Integer, ForeignKey("subscriptions.id"))
     status = Column(String, default="pending")  # pending / approved / rejected
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
 
     user = relationship("User")
     subscription = relationship("Subscription")
 
 
+class SchedulerJob(Base):
+    """Состояние фоновой задачи планировщика: интервал, в котором она уже выполнена"""
+    __tablename__ = "scheduler_jobs"
+
+    name = Column(String(100), primary_key=True)
+    last_run_at = Column(DateTime, nullable=True)  # окончание последнего успешного запуска
+    next_run_at = Column(DateTime, nullable=True)  # раньше этой границы интервала задача не запускается
+
+
+class IdempotencyKey(Base):
+    """Сохранённый ответ на запрос с заголовком Idempotency-Key"""
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (
+        UniqueConstraint("user_id", "key", name="uq_idempotency_keys_user_key"),
+        Index("ix_idempotency_keys_created", "created_at"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    key = Column(String(255), nullable=False)
+    endpoint = Column(String(100), nullable=False)
+    fingerprint = Column(String(64), nullable=False)  # sha256 тела запроса
+    # NULL — запрос ещё выполняется (ключ занят до вызова провайдера)
+    status_code = Column(Integer, nullable=True)
+    response = Column(JSONB, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class OutboxEvent(Base):
+    """Событие для доставки фоновым диспетчером (transactional outbox)"""
+    __tablename__ = "outbox_events"
+    __table_args__ = (
+        Index("ix_outbox_events_pending", "available_at", "id", postgresql_where=text("status = 'pending'")),
+    )
+
+    id = Column(Integer, primary_key=True)
+    topic = Column(String(50), nullable=False)
+    user_id = Column(Integer, nullable=True)
+    payload = Column(JSONB, nullable=False)
+    status = Column(String(10), default="pending", nullable=False)  # pending / failed
+    delivered = Column(JSONB, default=list, nullable=False)  # sink'и, которые уже получили событие
+    attempts = Column(Integer, default=0, nullable=False)
+    last_error = Column(Text, nullable=True)
+    available_at = Column(DateTime, default=datetime.utcnow, nullable=False)  # не раньше — для повторов
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
@@ -1,17 +1,15 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from app import models, schemas
-from app.database import get_db
+from app.database import get_async_db
 from jose import jwt
 from datetime import timedelta, datetime
 from app.auth import get_current_user
 from app.schemas import UserOut
 from app.models import User
-
-from passlib.context import CryptContext
-
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from app.services.passwords import PasswordHasherBusy, verify_password
 
 
 router = APIRouter(
@@ -32,20 +30,31 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
 
 
 @router.post("/token", response_model=schemas.Token)
-async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_db)):
     try:
-        user = db.query(models.User).filter(models.User.username == form_data.username).first()
+        result = await db.execute(select(models.User).where(models.User.username == form_data.username))
+        user = result.scalar_one_or_none()
 
         if not user:
             raise HTTPException(status_code=401, detail="User not found")
 
-        # Проверка пароля
-        if not pwd_context.verify(form_data.password, user.password_hash):
+        # Проверка пароля (в отдельном пуле потоков, не блокируя event loop)
+        valid, new_hash = await verify_password(form_data.password, user.password_hash)
+        if not valid:
             raise HTTPException(status_code=401, detail="Incorrect username or password")
 
+        # Стоимость bcrypt изменилась — сохраняем пересчитанный хеш
+        if new_hash:
+            user.password_hash = new_hash
+            await db.commit()
+
         access_token = create_access_token(data={"sub": str(user.id)})
         return {"access_token": access_token, "token_type": "bearer"}
 
+    except PasswordHasherBusy:
+        raise HTTPException(status_code=503, detail="Сервис перегружен, попробуйте позже")
+    except HTTPException:
+        raise
     except Exception as e:
         import traceback
         traceback.print_exc()  # Распечатает в консоль
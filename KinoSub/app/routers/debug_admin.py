@@ -2,6 +2,7 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from app.database import get_db
 from app.models import User
+from app.services.identity_cache import invalidate_user
 
 router = APIRouter(
     prefix="/admin",
@@ -16,4 +17,5 @@ def promote_to_admin(user_id: int, db: Session = Depends(get_db)):
 
     user.role = "admin"
     db.commit()
+    invalidate_user(user_id)
     return {"message": f"User {user_id} promoted to admin"}
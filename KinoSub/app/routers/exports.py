@@ -0,0 +1,45 @@
+from datetime import date, datetime
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Path, Query
+from fastapi.responses import StreamingResponse
+
+from app.auth import get_admin_user
+from app.services.export import export_query, stream_export
+from app.services.identity_cache import CachedUser
+
+router = APIRouter(
+    prefix="/admin/exports",
+    tags=["admin"]
+)
+
+MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+
+
+@router.get("/{name}")
+def export_table(
+    name: str = Path(..., pattern="^(payments|balance-transactions)$"),
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    gzip: bool = False,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    user_id: Optional[int] = None,
+    admin: CachedUser = Depends(get_admin_user)
+):
+    """
+    Полная выгрузка платежей или операций по балансу для бухгалтерии.
+    Отдаётся потоком по мере чтения из БД; gzip=true — файл .gz
+    """
+    query = export_query(name, date_from, date_to, user_id)
+    filename = f"{name}-{datetime.utcnow():%Y%m%d}.{format}"
+    if gzip:
+        filename += ".gz"
+
+    return StreamingResponse(
+        stream_export(query, format, gzip=gzip),
+        media_type="application/gzip" if gzip else MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
@@ -0,0 +1,16 @@
+from fastapi import APIRouter, Depends
+
+from app.dependencies.roles import require_admin
+from app.services.metrics import metrics
+
+router = APIRouter(
+    prefix="/metrics",
+    tags=["metrics"]
+)
+
+@router.get("/")
+def get_metrics(admin=Depends(require_admin)):
+    """
+    Снимок метрик процесса: пул соединений, очереди, фоновые задачи
+    """
+    return metrics.snapshot()
@@ -1,34 +1,135 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
+import asyncio
+import json
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session, raiseload
+from typing import Optional
 
 from app.models import Notification, User
-from app.schemas import NotificationOut
+from app.schemas import NotificationOut, NotificationsRead, Page, UnreadCount
+from app.services.pagination import Keyset
 from app.database import get_db
-from app.auth import get_current_user
+from app.auth import get_current_user, get_stream_user
+from app.config import settings
+from app.services.identity_cache import CachedUser
+from app.services.notification_hub import TooManyConnections, notification_hub
 
 router = APIRouter(
     prefix="/notifications",
     tags=["notifications"]
 )
 
-@router.get("/", response_model=List[NotificationOut])
+notifications_keyset = Keyset(Notification.created_at, Notification.id)
+
+@router.get("/", response_model=Page[NotificationOut])
 def get_user_notifications(
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     try:
-        notifications = db.query(Notification).filter(
-            Notification.user_id == current_user.id
-        ).order_by(Notification.created_at.desc()).all()
+        query = (
+            db.query(Notification)
+            .options(raiseload("*"))
+            .filter(Notification.user_id == current_user.id)
+        )
+        notifications = notifications_keyset.apply(query, cursor, limit).all()
 
-        return notifications
+        return notifications_keyset.page(notifications, limit)
+    except HTTPException:
+        raise
     except Exception as e:
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail="Ошибка при получении уведомлений")
 
 
+@router.get("/unread-count", response_model=UnreadCount)
+def get_unread_count(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Число непрочитанных уведомлений (считается по частичному индексу, без загрузки списка)
+    """
+    unread = db.scalar(
+        select(func.count())
+        .select_from(Notification)
+        .where(Notification.user_id == current_user.id, Notification.is_read == False)
+    )
+    return {"unread": unread}
+
+
+@router.post("/read")
+def mark_notifications_as_read(
+    data: NotificationsRead,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Пометить прочитанными несколько уведомлений одним UPDATE:
+    по списку ids или все, созданные не позже before
+    """
+    query = update(Notification).where(
+        Notification.user_id == current_user.id,
+        Notification.is_read == False,
+    )
+    if data.ids is not None:
+        query = query.where(Notification.id.in_(data.ids))
+    else:
+        query = query.where(Notification.created_at <= data.before)
+
+    result = db.execute(query.values(is_read=True).execution_options(synchronize_session=False))
+    db.commit()
+    return {"updated": result.rowcount}
+
+
+@router.get("/stream")
+async def stream_notifications(current_user: CachedUser = Depends(get_stream_user)):
+    """
+    Новые уведомления в реальном времени (Server-Sent Events).
+    Токен можно передать параметром ?token=, т.к. EventSource не отправляет заголовки.
+    Раз в notification_stream_heartbeat_seconds приходит комментарий-пинг
+    """
+    # ответ об ошибке ещё можно отдать статусом; место занимается уже в
+    # генераторе — иначе при обрыве до старта ответа оно не освободится
+    try:
+        notification_hub.check(current_user.id)
+    except TooManyConnections as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+    async def events():
+        try:
+            queue = notification_hub.subscribe(current_user.id)
+        except TooManyConnections as e:
+            # место заняли между проверкой и стартом ответа
+            yield f"retry: 5000\nevent: error\ndata: {json.dumps({'detail': e.detail}, ensure_ascii=False)}\n\n"
+            return
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    notification = await asyncio.wait_for(
+                        queue.get(), timeout=settings.notification_stream_heartbeat_seconds
+                    )
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                data = json.dumps(notification, ensure_ascii=False)
+                yield f"id: {notification['id']}\nevent: notification\ndata: {data}\n\n"
+        finally:
+            notification_hub.unsubscribe(current_user.id, queue)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.patch("/{notification_id}/read", response_model=NotificationOut)
 def mark_notification_as_read(
     notification_id: int,
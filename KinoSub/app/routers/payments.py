@@ -1,21 +1,35 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from datetime import datetime, timedelta
-from typing import List
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import raiseload
+from datetime import datetime
+from typing import Optional
 from decimal import Decimal
+import io
+import json
+import tempfile
 import uuid
 
-from app.database import get_db
+from app.config import settings
+from app.database import get_async_db
 from app.models import (
     Payment,
     UserSubscription,
-    Subscription,
     User,
-    Notification,
-    BalanceTransaction,
 )
-from app.auth import get_current_user
-from app.schemas import PaymentCreate, PaymentOut, RefundRequest, AutoRenewUpdate
+from app.auth import get_admin_user, get_current_user
+from app.services.catalog_cache import catalog_cache
+from app.services.identity_cache import CachedUser, invalidate_user
+from app.services.idempotency import IdempotentRequest
+from app.services.ledger import InsufficientFunds, credit, debit
+from app.services.outbox import enqueue_notification
+from app.services.payment_gateway import GatewayUnavailable, get_gateway
+from app.services.payment_reconcile import activate_subscription, settle_payment
+from app.schemas import PaymentCreate, PaymentOut, RefundRequest, AutoRenewUpdate, Page
+from app.services.pagination import Keyset
+from app.services.payment_ingest import ingest_payments
 
 router = APIRouter(
     prefix="/payments",
@@ -23,138 +37,215 @@ router = APIRouter(
 )
 
 
-def process_payment(amount: Decimal, method: str) -> dict:
-    return {
-        "status": "completed",
-        "transaction_id": f"pay_{uuid.uuid4()}"
-    }
+def create_notification(db: AsyncSession, user_id: int, message: str):
+    # уведомление доставит диспетчер outbox, здесь — только запись события
+    return enqueue_notification(db, user_id, message)
 
 
-def create_notification(db: Session, user_id: int, message: str):
-    notification = Notification(
-        user_id=user_id,
-        message=message,
-        is_read=False,
-        created_at=datetime.utcnow()
-    )
-    db.add(notification)
-    return notification
+def provider_reference(user_id: int, idempotency_key: Optional[str]) -> str:
+    """
+    Ссылка платежа — ключ идемпотентности у провайдера. С Idempotency-Key
+    она выводится из (user_id, ключ), и повтор запроса уходит к провайдеру
+    с той же ссылкой
+    """
+    if idempotency_key is None:
+        return f"pay_{uuid.uuid4()}"
+    return f"pay_{uuid.uuid5(uuid.NAMESPACE_OID, f'{user_id}:{idempotency_key}')}"
 
 
 @router.post("/", response_model=PaymentOut)
 async def create_payment(
     payment_data: PaymentCreate,
-    db: Session = Depends(get_db),
-    user: User = Depends(get_current_user)
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: CachedUser = Depends(get_current_user)
 ):
+    """
+    Оплата подписки. С баланса — одной транзакцией. Через провайдера —
+    pending -> completed/failed: платёж сохраняется как pending вместе
+    с занятым Idempotency-Key, провайдер вызывается уже после коммита
+    (соединение с БД в это время свободно),
+    затем статус меняется отдельной короткой транзакцией. Нет ответа
+    провайдера — 202 и платёж pending, итог узнает сверка (payment_reconcile)
+    """
     try:
-        amount = Decimal(str(payment_data.amount))
-
-        subscription = db.query(UserSubscription).filter(
-            UserSubscription.user_id == user.id,
-            UserSubscription.subscription_id == payment_data.subscription_id
-        ).first()
+        idempotent = IdempotentRequest.create(idempotency_key, current_user.id, "POST /payments/", payment_data)
+        replayed = await idempotent.replay(db)
+        if replayed:
+            return replayed
+
+        subscription = await db.scalar(
+            select(UserSubscription).where(
+                UserSubscription.user_id == current_user.id,
+                UserSubscription.subscription_id == payment_data.subscription_id
+            )
+        )
 
         if not subscription:
             raise HTTPException(status_code=404, detail="Subscription not assigned")
 
-        if payment_data.payment_method == "balance" and user.balance < amount:
-            raise HTTPException(status_code=400, detail="Insufficient funds")
-
-        payment_result = process_payment(amount, payment_data.payment_method)
-
-        if payment_result["status"] == "completed":
-            if payment_data.payment_method == "balance":
-                user.balance -= amount
-                transaction = BalanceTransaction(
-                    user_id=user.id,
-                    amount=amount,
-                    type="withdraw",
-                    description=f"Оплата подписки #{payment_data.subscription_id}"
-                )
-                db.add(transaction)
-
-            if not subscription.end_date or subscription.end_date < datetime.utcnow().date():
-                sub_info = db.query(Subscription).get(payment_data.subscription_id)
-                subscription.start_date = datetime.utcnow().date()
-                subscription.end_date = datetime.utcnow().date() + timedelta(days=sub_info.duration_days)
-
-            subscription.is_active = True
+        # цена — из таблицы цен каталога (со скидкой), сумме от клиента не доверяем
+        catalog = await run_in_threadpool(catalog_cache.snapshot)
+        amount = catalog.prices.price(payment_data.subscription_id, datetime.utcnow().date())
+        if amount is None:
+            raise HTTPException(status_code=404, detail="Подписка не найдена")
+        if amount <= 0:
+            raise HTTPException(status_code=400, detail="Подписка недоступна для оплаты: цена не больше 0")
+        if payment_data.amount is not None and Decimal(str(payment_data.amount)) != amount:
+            raise HTTPException(status_code=400, detail="Сумма не совпадает с текущей ценой подписки")
 
         payment = Payment(
-            user_id=user.id,
+            user_id=current_user.id,
             subscription_id=payment_data.subscription_id,
             amount=amount,
-            status=payment_result["status"],
+            status="pending",
             payment_method=payment_data.payment_method,
-            external_id=payment_result["transaction_id"],
-            created_at=datetime.utcnow()
+            external_id=f"pay_{uuid.uuid4()}",
+            created_at=datetime.utcnow(),
+            is_refunded=False
         )
         db.add(payment)
 
-        create_notification(
-            db,
-            user.id,
-            f"Оплата {amount}₽ за подписку #{payment_data.subscription_id}"
-        )
-
-        db.commit()
-        db.refresh(payment)
-        return payment
-
+        if payment_data.payment_method == "balance":
+            try:
+                await debit(db, current_user.id, amount, f"Оплата подписки #{payment_data.subscription_id}")
+            except InsufficientFunds:
+                raise HTTPException(status_code=400, detail="Insufficient funds")
+            payment.status = "completed"
+            await activate_subscription(db, subscription)
+            create_notification(
+                db,
+                current_user.id,
+                f"Оплата {amount}₽ за подписку #{payment_data.subscription_id}"
+            )
+        else:
+            payment.external_id = provider_reference(current_user.id, idempotent.key)
+            # ключ занимается до списания: параллельный повтор не создаст
+            # второй платёж и не пойдёт к провайдеру
+            replayed = await idempotent.reserve(db)
+            if replayed:
+                return replayed
+
+            try:
+                # external_id — ключ идемпотентности у провайдера
+                result = await get_gateway().charge(payment.external_id, amount, payment_data.payment_method)
+            except GatewayUnavailable:
+                # провайдер мог уже списать деньги: платёж остаётся pending до сверки
+                response.status_code = status.HTTP_202_ACCEPTED
+            else:
+                await settle_payment(db, payment.id, result)
+
+        await db.flush()
+        await db.refresh(payment)
+        body = PaymentOut.model_validate(payment, from_attributes=True)
+        replayed = await idempotent.commit(db, body, status_code=response.status_code or 200)
+        if replayed:
+            return replayed
+        invalidate_user(current_user.id)
+        return body
+
+    except HTTPException:
+        raise
+    except ValueError as e:
+        # некорректная сумма операции по балансу (ledger)
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception:
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail="Ошибка при создании платежа")
 
 
-@router.get("/", response_model=List[PaymentOut])
+@router.post("/bulk")
+async def bulk_payments(
+    request: Request,
+    format: Optional[str] = Query(None, pattern="^(ndjson|csv)$"),
+    admin: CachedUser = Depends(get_admin_user)
+):
+    """
+    Загрузка файла расчётов от процессинга: NDJSON или CSV (по Content-Type
+    или параметру format). В ответ — NDJSON с результатом по каждой строке
+    """
+    fmt = format or ("csv" if "csv" in request.headers.get("content-type", "") else "ndjson")
+
+    # Тело сначала складываем во временный файл (в память — только до
+    # payment_ingest_spool_bytes): StreamingResponse сам читает receive(),
+    # поэтому дочитывать запрос во время ответа нельзя
+    spool = tempfile.SpooledTemporaryFile(max_size=settings.payment_ingest_spool_bytes)
+    async for chunk in request.stream():
+        spool.write(chunk)
+    spool.seek(0)
+    lines = io.TextIOWrapper(spool, encoding="utf-8-sig", newline="")
+
+    async def results():
+        try:
+            async for result in ingest_payments(lines, fmt):
+                yield json.dumps(result, ensure_ascii=False) + "\n"
+        finally:
+            lines.close()
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+
+payments_keyset = Keyset(Payment.created_at, Payment.id)
+
+
+@router.get("/", response_model=Page[PaymentOut])
 async def get_payments(
-    skip: int = 0,
-    limit: int = 100,
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=500),
+    db: AsyncSession = Depends(get_async_db),
     user: User = Depends(get_current_user)
 ):
-    return db.query(Payment)\
-        .filter(Payment.user_id == user.id)\
-        .offset(skip)\
-        .limit(limit)\
-        .all()
+    query = select(Payment).options(raiseload("*")).where(Payment.user_id == user.id)
+    result = await db.execute(payments_keyset.apply(query, cursor, limit))
+    return payments_keyset.page(result.scalars(), limit)
 
 
 @router.post("/{payment_id}/refund", response_model=PaymentOut)
 async def refund_payment(
     payment_id: int,
     refund: RefundRequest,
-    db: Session = Depends(get_db),
-    user: User = Depends(get_current_user)
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: CachedUser = Depends(get_current_user)
 ):
-    payment = db.query(Payment).filter(Payment.id == payment_id, Payment.user_id == user.id).first()
-
-    if not payment:
-        raise HTTPException(status_code=404, detail="Платёж не найден")
+    idempotent = IdempotentRequest.create(idempotency_key, current_user.id, f"POST /payments/{payment_id}/refund", refund)
+    replayed = await idempotent.replay(db)
+    if replayed:
+        return replayed
+
+    # Помечаем платёж возвращённым условным UPDATE: из двух параллельных
+    # запросов на возврат деньги зачислит только один
+    refunded = await db.execute(
+        update(Payment)
+        .where(
+            Payment.id == payment_id,
+            Payment.user_id == current_user.id,
+            Payment.status == "completed",
+            Payment.is_refunded == False,
+        )
+        .values(is_refunded=True, refund_reason=refund.reason, status="refunded")
+        .returning(Payment.id, Payment.amount, Payment.subscription_id)
+    )
+    refunded = refunded.first()
 
-    if payment.status != "completed" or payment.is_refunded:
+    if not refunded:
+        exists = await db.scalar(
+            select(Payment.id).where(Payment.id == payment_id, Payment.user_id == current_user.id)
+        )
+        if not exists:
+            raise HTTPException(status_code=404, detail="Платёж не найден")
         raise HTTPException(status_code=400, detail="Платёж уже возвращён или не был успешным")
 
-    user.balance += payment.amount
+    await credit(db, current_user.id, refunded.amount, f"Возврат по платежу #{refunded.id}")
 
-    transaction = BalanceTransaction(
-        user_id=user.id,
-        amount=payment.amount,
-        type="topup",
-        description=f"Возврат по платежу #{payment.id}"
+    subscription = await db.scalar(
+        select(UserSubscription).filter_by(
+            user_id=current_user.id,
+            subscription_id=refunded.subscription_id
+        )
     )
-    db.add(transaction)
-
-    payment.is_refunded = True
-    payment.refund_reason = refund.reason
-    payment.status = "refunded"
-
-    subscription = db.query(UserSubscription).filter_by(
-        user_id=user.id,
-        subscription_id=payment.subscription_id
-    ).first()
 
     if subscription:
         subscription.is_active = False
@@ -162,30 +253,35 @@ async def refund_payment(
 
     create_notification(
         db,
-        user.id,
-        f"Произведён возврат {payment.amount}₽ по платежу #{payment.id}"
+        current_user.id,
+        f"Произведён возврат {refunded.amount}₽ по платежу #{refunded.id}"
     )
 
-    db.commit()
-    db.refresh(payment)
-    return payment
+    response = PaymentOut.model_validate(await db.get(Payment, refunded.id), from_attributes=True)
+    replayed = await idempotent.commit(db, response)
+    if replayed:
+        return replayed
+    invalidate_user(current_user.id)
+    return response
 
 
 @router.patch("/subscriptions/{subscription_id}/auto-renew")
-def toggle_auto_renew(
+async def toggle_auto_renew(
     subscription_id: int,
     data: AutoRenewUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     user: User = Depends(get_current_user)
 ):
-    usub = db.query(UserSubscription).filter_by(
-        user_id=user.id,
-        subscription_id=subscription_id
-    ).first()
+    usub = await db.scalar(
+        select(UserSubscription).filter_by(
+            user_id=user.id,
+            subscription_id=subscription_id
+        )
+    )
 
     if not usub:
         raise HTTPException(status_code=404, detail="Подписка не найдена")
 
     usub.auto_renew = data.enable
-    db.commit()
+    await db.commit()
     return {"subscription_id": subscription_id, "auto_renew": usub.auto_renew}
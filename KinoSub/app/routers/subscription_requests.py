@@ -1,12 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy import false, func, literal, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session, joinedload
+from typing import Optional
 from datetime import datetime
 
+from app.config import settings
 from app.database import get_db
 from app.models import SubscriptionRequest, User, UserSubscription, Subscription
 from app.auth import get_current_user, get_admin_user
-from app.schemas import SubscriptionRequestCreate, SubscriptionRequestOut
+from app.schemas import SubscriptionRequestCreate, SubscriptionRequestOut, SubscriptionRequestStatus, SubscriptionRequestsBulk, Page
+from app.services.metrics import metrics
+from app.services.pagination import Keyset
 
 router = APIRouter(
     prefix="/subscription-requests",
@@ -45,13 +50,44 @@ def create_subscription_request(
     return new_request
 
 
-# Админ получает список всех заявок
-@router.get("/admin", response_model=List[SubscriptionRequestOut])
+# ожидающие — очередь от старых к новым, обработанные — история от новых к старым
+pending_keyset = Keyset(SubscriptionRequest.created_at, SubscriptionRequest.id, descending=False)
+history_keyset = Keyset(SubscriptionRequest.created_at, SubscriptionRequest.id)
+
+
+# Админ получает заявки по статусу (по умолчанию — ожидающие), постранично
+@router.get("/admin", response_model=Page[SubscriptionRequestOut])
 def get_all_requests(
+    request_status: SubscriptionRequestStatus = Query(SubscriptionRequestStatus.pending, alias="status"),
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    db: Session = Depends(get_db),
+    admin: User = Depends(get_admin_user)
+):
+    """
+    Страница заявок с нужным статусом. Идёт по индексу статуса
+    (для pending — частичному), поэтому не зависит от объёма истории
+    """
+    keyset = pending_keyset if request_status == SubscriptionRequestStatus.pending else history_keyset
+    # пользователь и подписка — в том же запросе (many-to-one, JOIN), без запроса на каждую заявку
+    query = (
+        db.query(SubscriptionRequest)
+        .options(joinedload(SubscriptionRequest.user), joinedload(SubscriptionRequest.subscription))
+        .filter(SubscriptionRequest.status == request_status.value)
+    )
+    return keyset.page(keyset.apply(query, cursor, limit).all(), limit)
+
+
+@router.get("/admin/pending-count")
+def get_pending_count(
     db: Session = Depends(get_db),
     admin: User = Depends(get_admin_user)
 ):
-    return db.query(SubscriptionRequest).order_by(SubscriptionRequest.created_at.desc()).all()
+    """Число ожидающих заявок (по частичному индексу)"""
+    pending = db.scalar(
+        select(func.count()).select_from(SubscriptionRequest).where(SubscriptionRequest.status == "pending")
+    )
+    return {"pending": pending}
 
 
 # Админ одобряет заявку
@@ -108,3 +144,93 @@ def reject_request(
     db.commit()
     db.refresh(req)
     return req
+
+
+def _bulk_conditions(data: SubscriptionRequestsBulk) -> list:
+    if data.ids is not None:
+        return [SubscriptionRequest.id.in_(data.ids)]
+    conditions = []
+    if data.filter.subscription_id is not None:
+        conditions.append(SubscriptionRequest.subscription_id == data.filter.subscription_id)
+    if data.filter.created_before is not None:
+        conditions.append(SubscriptionRequest.created_at < data.filter.created_before)
+    return conditions
+
+
+def _review_chunk(db: Session, action: str, conditions: list, after_id: int, chunk_size: int) -> tuple:
+    """
+    Одна пачка: один UPDATE статусов (захватывает следующие chunk_size
+    ожидающих заявок по id) и для одобрения — один INSERT ... SELECT
+    в user_subscriptions. Возвращает (id обработанных заявок, создано подписок)
+    """
+    chunk = (
+        select(SubscriptionRequest.id)
+        .where(SubscriptionRequest.status == "pending", SubscriptionRequest.id > after_id, *conditions)
+        .order_by(SubscriptionRequest.id)
+        .limit(chunk_size)
+        .with_for_update(skip_locked=True)
+    )
+    ids = db.scalars(
+        update(SubscriptionRequest)
+        .where(SubscriptionRequest.id.in_(chunk.scalar_subquery()))
+        .values(status="approved" if action == "approve" else "rejected")
+        .returning(SubscriptionRequest.id)
+        .execution_options(synchronize_session=False)
+    ).all()
+    if not ids or action != "approve":
+        return ids, 0
+
+    # как и при одиночном одобрении: подписка неактивна до оплаты,
+    # уже назначенные подписки не трогаем (ON CONFLICT DO NOTHING)
+    pairs = (
+        select(
+            SubscriptionRequest.user_id,
+            SubscriptionRequest.subscription_id,
+            literal(datetime.utcnow().date()),
+            false(),
+            false(),
+        )
+        .where(SubscriptionRequest.id.in_(ids))
+        .distinct()
+    )
+    created = db.execute(
+        pg_insert(UserSubscription)
+        .from_select(["user_id", "subscription_id", "start_date", "is_active", "auto_renew"], pairs)
+        .on_conflict_do_nothing(constraint="uq_user_subscriptions_user_subscription")
+    )
+    return ids, created.rowcount
+
+
+# Админ одобряет или отклоняет заявки пачкой: по списку id или по фильтру
+@router.post("/admin/bulk")
+def bulk_review_requests(
+    data: SubscriptionRequestsBulk,
+    db: Session = Depends(get_db),
+    admin: User = Depends(get_admin_user)
+):
+    """
+    Обработка идёт пачками по subscription_requests_bulk_chunk_size заявок,
+    каждая пачка — своя короткая транзакция. Уже обработанные заявки и
+    заявки, которые в этот момент обрабатывает другой админ, пропускаются
+    """
+    conditions = _bulk_conditions(data)
+    chunk_size = settings.subscription_requests_bulk_chunk_size
+    summary = {"action": data.action, "processed": 0, "created_subscriptions": 0, "chunks": 0}
+    last_id = 0
+
+    while True:
+        ids, created = _review_chunk(db, data.action, conditions, last_id, chunk_size)
+        db.commit()
+        if not ids:
+            break
+        summary["chunks"] += 1
+        summary["processed"] += len(ids)
+        summary["created_subscriptions"] += created
+        last_id = max(ids)
+        if len(ids) < chunk_size:
+            break
+
+    if data.ids is not None:
+        summary["skipped"] = len(set(data.ids)) - summary["processed"]
+    metrics.inc(f"subscription_requests.bulk.{data.action}", summary["processed"])
+    return summary
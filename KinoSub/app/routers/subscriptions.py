@@ -1,11 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, status
 from sqlalchemy.orm import Session
-from typing import List
+from typing import Optional
 from datetime import datetime, timedelta
 
 from app.database import get_db
 from app.models import Subscription
-from app.schemas import SubscriptionCreate, SubscriptionUpdate, SubscriptionOut
+from app.schemas import SubscriptionCreate, SubscriptionUpdate, SubscriptionOut, Page
+from app.services.catalog_cache import catalog_cache, catalog_response, notify_catalog_changed
+from app.services.pagination import Keyset
+from app.services.pricing import effective_price
 from app.dependencies.roles import require_admin  # новая зависимость
 
 router = APIRouter(
@@ -13,20 +16,26 @@ router = APIRouter(
     tags=["subscriptions"]
 )
 
+
+def _with_price(subscription: Subscription) -> SubscriptionOut:
+    out = SubscriptionOut.model_validate(subscription)
+    out.effective_price = float(effective_price(subscription, datetime.utcnow().date()))
+    return out
+
 @router.post("/", response_model=SubscriptionOut)
 def create_subscription(
         subscription: SubscriptionCreate,
         db: Session = Depends(get_db),
         admin: str = Depends(require_admin)  # ограничение
 ):
-    if subscription.discount_rate and not subscription.discount_until:
-        raise HTTPException(status_code=400, detail="Для скидки укажите discount_until")
-
     db_subscription = Subscription(**subscription.dict())
     db.add(db_subscription)
+    db.flush()
+    version = notify_catalog_changed(db)
     db.commit()
+    catalog_cache.invalidate(version)
     db.refresh(db_subscription)
-    return db_subscription
+    return _with_price(db_subscription)
 
 @router.put("/{subscription_id}", response_model=SubscriptionOut)
 def update_subscription(
@@ -42,9 +51,11 @@ def update_subscription(
     for key, value in subscription.dict(exclude_unset=True).items():
         setattr(db_subscription, key, value)
 
+    version = notify_catalog_changed(db)
     db.commit()
+    catalog_cache.invalidate(version)
     db.refresh(db_subscription)
-    return db_subscription
+    return _with_price(db_subscription)
 
 @router.delete("/{subscription_id}")
 def delete_subscription(
@@ -57,19 +68,40 @@ def delete_subscription(
         raise HTTPException(status_code=404, detail="Подписка не найдена")
 
     db.delete(db_subscription)
+    version = notify_catalog_changed(db)
     db.commit()
+    catalog_cache.invalidate(version)
     return {"message": "Подписка удалена"}
 
-@router.get("/", response_model=List[SubscriptionOut])
-def get_subscriptions(skip: int = 0, limit: int = 100, active_only: bool = False, db: Session = Depends(get_db)):
-    query = db.query(Subscription)
-    if active_only:
-        query = query.filter(Subscription.is_active == True)
-    return query.offset(skip).limit(limit).all()
+subscriptions_keyset = Keyset(Subscription.id, descending=False)
+
+# Чтение каталога идёт из кэша в памяти (services/catalog_cache.py):
+# ответы с ETag, If-None-Match -> 304 без обращения к БД
+
+@router.get("/", response_model=Page[SubscriptionOut])
+def get_subscriptions(
+        cursor: Optional[str] = None,
+        limit: int = Query(100, ge=1, le=500),
+        active_only: bool = False,
+        if_none_match: Optional[str] = Header(None)
+):
+    after = subscriptions_keyset.decode(cursor)[0] if cursor else 0
+    snapshot = catalog_cache.snapshot()
+
+    def build() -> bytes:
+        items = [s for s in snapshot.items if s.id > after and (s.is_active or not active_only)]
+        page = subscriptions_keyset.page(items[:limit + 1], limit)
+        return Page[SubscriptionOut](**page).model_dump_json().encode()
+
+    cached = catalog_cache.render(snapshot, ("list", after, limit, active_only), build)
+    return catalog_response(cached, if_none_match)
 
 @router.get("/{subscription_id}", response_model=SubscriptionOut)
-def get_subscription(subscription_id: int, db: Session = Depends(get_db)):
-    subscription = db.query(Subscription).filter(Subscription.id == subscription_id).first()
+def get_subscription(subscription_id: int, if_none_match: Optional[str] = Header(None)):
+    snapshot = catalog_cache.snapshot()
+    subscription = snapshot.by_id.get(subscription_id)
     if not subscription:
         raise HTTPException(status_code=404, detail="Подписка не найдена")
-    return subscription
+
+    cached = catalog_cache.render(snapshot, ("item", subscription_id), subscription.model_dump_json().encode)
+    return catalog_response(cached, if_none_match)
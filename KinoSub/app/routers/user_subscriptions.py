@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from datetime import date, timedelta
+from sqlalchemy.orm import Session, raiseload, selectinload
+from datetime import date, datetime, timedelta
 from typing import List
 
 from app.models import UserSubscription, User, Subscription
@@ -55,17 +55,26 @@ def get_my_subscriptions(
     db: Session = Depends(get_db),
     user: User = Depends(get_current_user)
 ):
-    subscriptions = db.query(UserSubscription).filter(
-        UserSubscription.user_id == user.id
-    ).all()
-
-    today = date.today()
-    for sub in subscriptions:
-        if sub.end_date and sub.end_date < today:
-            sub.is_active = False
+    """
+    Только чтение: каталог подгружается одним запросом (selectinload),
+    истёкшие подписки показываются неактивными, а в БД их отключает
+    фоновая задача expire_subscriptions
+    """
+    subscriptions = (
+        db.query(UserSubscription)
+        .options(selectinload(UserSubscription.subscription), raiseload("*"))
+        .filter(UserSubscription.user_id == user.id)
+        .order_by(UserSubscription.id)
+        .all()
+    )
 
-    db.commit()
-    return subscriptions
+    today = datetime.utcnow().date()
+    return [
+        UserSubscriptionOut.model_validate(sub).model_copy(update={
+            "is_active": sub.is_active and (sub.end_date is None or sub.end_date >= today)
+        })
+        for sub in subscriptions
+    ]
 
 
 # 👇 Продление подписки — либо админ, либо владелец
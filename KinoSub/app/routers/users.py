@@ -1,10 +1,14 @@
-from typing import List
+from typing import Optional
 from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
-from passlib.context import CryptContext
-from app.database import get_db
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import raiseload
+from app.database import get_async_db
 from app.models import User
-from app.schemas import UserCreate, UserOut, UserUpdate
+from app.schemas import UserCreate, UserOut, UserUpdate, Page
+from app.services.identity_cache import invalidate_user
+from app.services.pagination import Keyset
+from app.services.passwords import PasswordHasherBusy, hash_password
 from datetime import datetime
 
 router = APIRouter(
@@ -12,15 +16,22 @@ router = APIRouter(
     tags=["Users"]
 )
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+async def _hash_or_503(password: str) -> str:
+    try:
+        return await hash_password(password)
+    except PasswordHasherBusy:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Сервис перегружен, попробуйте позже"
+        )
 
 # добавление пользователя
 @router.post("/", response_model=UserOut, status_code=status.HTTP_201_CREATED)
-def create_user(user: UserCreate, db: Session = Depends(get_db)):
+async def create_user(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
     """Создание пользователя с хешированием пароля"""
-    existing_user = db.query(User).filter(
-        (User.email == user.email) | (User.username == user.username)
-    ).first()
+    existing_user = await db.scalar(
+        select(User).where((User.email == user.email) | (User.username == user.username))
+    )
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -28,7 +39,7 @@ def create_user(user: UserCreate, db: Session = Depends(get_db)):
         )
 
     # Хешируем пароль перед сохранением
-    hashed_password = pwd_context.hash(user.password)
+    hashed_password = await _hash_or_503(user.password)
 
     # Создаём пользователя
     db_user = User(
@@ -40,23 +51,25 @@ def create_user(user: UserCreate, db: Session = Depends(get_db)):
         created_at=datetime.utcnow(),
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     return db_user
 
-@router.get("/", response_model=List[UserOut])
-def get_all_users(
-    db: Session = Depends(get_db),
-    skip: int = Query(0, description="Пагинация: пропуск записей"),
-    limit: int = Query(100, description="Пагинация: лимит записей")
+users_keyset = Keyset(User.id, descending=False)
+
+@router.get("/", response_model=Page[UserOut])
+async def get_all_users(
+    db: AsyncSession = Depends(get_async_db),
+    cursor: Optional[str] = Query(None, description="Пагинация: курсор из next_cursor"),
+    limit: int = Query(100, ge=1, le=500, description="Пагинация: лимит записей")
 ):
-    """Получение списка пользователей с пагинацией"""
-    users = db.query(User).offset(skip).limit(limit).all()
-    return users
+    """Получение списка пользователей с курсорной пагинацией"""
+    result = await db.execute(users_keyset.apply(select(User).options(raiseload("*")), cursor, limit))
+    return users_keyset.page(result.scalars(), limit)
 
 @router.get("/{user_id}", response_model=UserOut)
-def read_user(user_id: int, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.id == user_id).first()
+async def read_user(user_id: int, db: AsyncSession = Depends(get_async_db)):
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -65,13 +78,13 @@ def read_user(user_id: int, db: Session = Depends(get_db)):
     return user
 
 @router.patch("/{user_id}", response_model=UserOut)
-def update_user(
+async def update_user(
     user_id: int,
     user_data: UserUpdate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Обновление пользователя (с проверкой пароля)"""
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -84,21 +97,23 @@ def update_user(
     if user_data.email:
         user.email = user_data.email
     if user_data.password:  # Если пароль передан — хешируем его
-        user.password_hash = pwd_context.hash(user_data.password)
+        user.password_hash = await _hash_or_503(user_data.password)
 
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
+    invalidate_user(user.id)
     return user
 
 @router.delete("/{user_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_user(user_id: int, db: Session = Depends(get_db)):
+async def delete_user(user_id: int, db: AsyncSession = Depends(get_async_db)):
     """Удаление пользователя"""
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Пользователь не найден"
         )
-    db.delete(user)
-    db.commit()
+    await db.delete(user)
+    await db.commit()
+    invalidate_user(user_id)
     return  # 204 No Content
\ No newline at end of file
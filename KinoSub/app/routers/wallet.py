@@ -1,11 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-
-from app.database import get_db
-from app.models import User, BalanceTransaction
-from app.schemas import BalanceUpdate
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, status
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import raiseload
+
+from app.database import get_async_db
+from app.models import User, BalanceTransaction, TransactionType
+from app.schemas import BalanceUpdate, BalanceTransactionOut, MonthlyBalanceSummary, Page
+from app.schemas import TransactionType as TransactionTypeFilter
 from app.auth import get_current_user
-from datetime import datetime
+from app.services.identity_cache import invalidate_user
+from app.services.idempotency import IdempotentRequest
+from app.services.ledger import InsufficientFunds, credit, debit
+from app.services.pagination import Keyset
+from datetime import date, timedelta
+from typing import List, Optional
 from fastapi import Request
 import traceback
 
@@ -16,13 +24,15 @@ router = APIRouter(
 
 @router.get("/balance", response_model=float)
 async def get_user_balance(
-        db: Session = Depends(get_db),
+        db: AsyncSession = Depends(get_async_db),
         current_user: User = Depends(get_current_user)
 ):
     """
     Получить текущий баланс пользователя
     """
-    return float(current_user.balance)
+    # Баланс читаем из БД: в кэше авторизации он может отставать на других воркерах
+    balance = await db.scalar(select(User.balance).where(User.id == current_user.id))
+    return float(balance)
 
 
 from decimal import Decimal
@@ -30,10 +40,16 @@ from decimal import Decimal
 @router.post("/topup", status_code=status.HTTP_200_OK)
 async def top_up_balance(
     balance_data: BalanceUpdate,
-    db: Session = Depends(get_db),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     try:
+        idempotent = IdempotentRequest.create(idempotency_key, current_user.id, "POST /wallet/topup", balance_data)
+        replayed = await idempotent.replay(db)
+        if replayed:
+            return replayed
+
         if balance_data.amount <= 0:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -41,24 +57,25 @@ async def top_up_balance(
             )
 
         amount_decimal = Decimal(str(balance_data.amount))  # 🔥 безопасное преобразование
-        current_user.balance += amount_decimal
-
-        transaction = BalanceTransaction(
-            user_id=current_user.id,
-            amount=amount_decimal,
-            type="topup",
-            description=balance_data.description or "Пополнение баланса"
+        new_balance = await credit(
+            db,
+            current_user.id,
+            amount_decimal,
+            balance_data.description or "Пополнение баланса"
         )
-
-        db.add(transaction)
-        db.commit()
-        db.refresh(current_user)
-
-        return {
+        response = {
             "message": "Баланс успешно пополнен",
-            "new_balance": float(current_user.balance)
+            "new_balance": float(new_balance)
         }
+        replayed = await idempotent.commit(db, response)
+        if replayed:
+            return replayed
+        invalidate_user(current_user.id)
+
+        return response
 
+    except HTTPException:
+        raise
     except Exception as e:
         print("❌ Ошибка при пополнении баланса:")
         import traceback
@@ -71,61 +88,133 @@ async def top_up_balance(
 @router.post("/withdraw", status_code=status.HTTP_200_OK)
 async def withdraw_from_balance(
         balance_data: BalanceUpdate,
-        db: Session = Depends(get_db),
+        idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+        db: AsyncSession = Depends(get_async_db),
         current_user: User = Depends(get_current_user)
 ):
     """
     Списать средства с баланса (для оплаты подписки)
     """
+    idempotent = IdempotentRequest.create(idempotency_key, current_user.id, "POST /wallet/withdraw", balance_data)
+    replayed = await idempotent.replay(db)
+    if replayed:
+        return replayed
+
     if balance_data.amount <= 0:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Сумма списания должна быть больше 0"
         )
 
-    if current_user.balance < balance_data.amount:
+    try:
+        # проверка баланса и списание — один условный UPDATE
+        new_balance = await debit(
+            db,
+            current_user.id,
+            balance_data.amount,
+            balance_data.description or "Списание средств"
+        )
+    except InsufficientFunds:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Недостаточно средств на балансе"
         )
 
-    current_user.balance -= balance_data.amount
+    response = {
+        "message": "Средства успешно списаны",
+        "new_balance": float(new_balance)
+    }
+    replayed = await idempotent.commit(db, response)
+    if replayed:
+        return replayed
+    invalidate_user(current_user.id)
 
-    transaction = BalanceTransaction(
-        user_id=current_user.id,
-        amount=balance_data.amount,
-        type="withdraw",
-        description=balance_data.description or "Списание средств",
-        created_at=datetime.utcnow()
-    )
+    return response
 
-    db.add(transaction)
-    db.commit()
 
-    return {
-        "message": "Средства успешно списаны",
-        "new_balance": float(current_user.balance)
-    }
+history_keyset = Keyset(BalanceTransaction.created_at, BalanceTransaction.id)
+
 
+def _history_filters(user_id: int, date_from: Optional[date], date_to: Optional[date],
+                     type: Optional[TransactionTypeFilter] = None) -> list:
+    """Условия по пользователю и периоду (date_to включительно) — идут по индексу (user_id, created_at, id)"""
+    filters = [BalanceTransaction.user_id == user_id]
+    if date_from:
+        filters.append(BalanceTransaction.created_at >= date_from)
+    if date_to:
+        filters.append(BalanceTransaction.created_at < date_to + timedelta(days=1))
+    if type:
+        filters.append(BalanceTransaction.type == TransactionType(type.value))
+    return filters
 
-@router.get("/history")
+
+@router.get("/history", response_model=Page[BalanceTransactionOut])
 async def get_balance_history(
-        db: Session = Depends(get_db),
+        cursor: Optional[str] = None,
+        limit: int = Query(100, ge=1, le=500),
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None,
+        type: Optional[TransactionTypeFilter] = None,
+        db: AsyncSession = Depends(get_async_db),
         current_user: User = Depends(get_current_user)
 ):
     """
-    Получить историю операций с балансом
+    Получить историю операций с балансом (постранично, от новых к старым).
+    Можно ограничить периодом и типом операции
     """
-    history = db.query(BalanceTransaction).filter(
-        BalanceTransaction.user_id == current_user.id
-    ).order_by(BalanceTransaction.created_at.desc()).all()
+    query = (
+        select(BalanceTransaction)
+        .options(raiseload("*"))
+        .where(*_history_filters(current_user.id, date_from, date_to, type))
+    )
+    result = await db.execute(history_keyset.apply(query, cursor, limit))
+    page = history_keyset.page(result.scalars(), limit)
 
-    return [
+    page["items"] = [
         {
             "id": t.id,
             "amount": float(t.amount),
-            "type": t.type,
+            "type": t.type.value,
             "description": t.description,
-            "created_at": t.created_at.isoformat()
-        } for t in history
+            "created_at": t.created_at
+        } for t in page["items"]
+    ]
+    return page
+
+
+@router.get("/summary", response_model=List[MonthlyBalanceSummary])
+async def get_balance_summary(
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None,
+        db: AsyncSession = Depends(get_async_db),
+        current_user: User = Depends(get_current_user)
+):
+    """
+    Суммы пополнений и списаний по месяцам (от новых к старым).
+    Считается в БД одним GROUP BY, строки операций в приложение не загружаются
+    """
+    month = func.date_trunc("month", BalanceTransaction.created_at).label("month")
+    result = await db.execute(
+        select(
+            month,
+            func.coalesce(
+                func.sum(BalanceTransaction.amount).filter(BalanceTransaction.type == TransactionType.topup), 0
+            ).label("topup"),
+            func.coalesce(
+                func.sum(BalanceTransaction.amount).filter(BalanceTransaction.type == TransactionType.withdraw), 0
+            ).label("withdraw"),
+            func.count().label("operations"),
+        )
+        .where(*_history_filters(current_user.id, date_from, date_to))
+        .group_by(month)
+        .order_by(month.desc())
+    )
+
+    return [
+        {
+            "month": row.month.date(),
+            "topup": float(row.topup),
+            "withdraw": float(row.withdraw),
+            "operations": row.operations,
+        } for row in result
     ]
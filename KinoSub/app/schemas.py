@@ -1,10 +1,28 @@
-from pydantic import BaseModel, EmailStr, Field
-from datetime import datetime, date
-from typing import Optional
+from pydantic import AfterValidator, BaseModel, EmailStr, Field, model_validator
+from datetime import datetime, date, timezone
+from typing import Annotated, Generic, List, Literal, Optional, TypeVar
 import uuid
 from enum import Enum
 from decimal import Decimal
 
+# !!! страница курсорной пагинации !!!
+T = TypeVar("T")
+
+class Page(BaseModel, Generic[T]):
+    items: List[T]
+    next_cursor: Optional[str] = None  # None — это последняя страница
+
+
+# !!! время от клиента !!!
+def _naive_utc(value: datetime) -> datetime:
+    # в БД created_at — наивное UTC; время с поясом ("...Z" из toISOString)
+    # приводим к нему, иначе Postgres сравнит его в поясе сервера
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+UtcDatetime = Annotated[datetime, AfterValidator(_naive_utc)]
+
 # !!! классы для USER !!!
 class UserBase(BaseModel):
     username: str
@@ -35,22 +53,25 @@ class SubscriptionBase(BaseModel):
     description: Optional[str] = None
     is_active: bool = True
     discount_rate: Optional[float] = None
-    discount_until: Optional[date] = None
+    discount_until: Optional[date] = None  # последний день скидки; None — скидка бессрочная
 
 class SubscriptionCreate(SubscriptionBase):
-    pass
+    price: float = Field(gt=0)
+    # доля скидки: 0.25 — минус 25%; скидка 100% и больше дала бы цену <= 0
+    discount_rate: Optional[float] = Field(None, ge=0, lt=1)
 
 class SubscriptionUpdate(BaseModel):
     name: Optional[str] = None
-    price: Optional[float] = None
+    price: Optional[float] = Field(None, gt=0)
     duration_days: Optional[int] = None
     description: Optional[str] = None
     is_active: Optional[bool] = None
-    discount_rate: Optional[float] = None
+    discount_rate: Optional[float] = Field(None, ge=0, lt=1)
     discount_until: Optional[date] = None
 
 class SubscriptionOut(SubscriptionBase):
     id: int
+    effective_price: Optional[float] = None  # цена сегодня с учётом скидки
 
     class Config:
         from_attributes = True
@@ -87,7 +108,8 @@ from decimal import Decimal
 
 class PaymentCreate(BaseModel):
     subscription_id: int
-    amount: Decimal
+    # цену считает сервер; если передана — должна совпадать
+    amount: Optional[Decimal] = Field(None, gt=0, max_digits=10, decimal_places=2)
     payment_method: str  # "balance", "card", "yoomoney" и т.д.
 
 
@@ -107,6 +129,15 @@ class PaymentOut(BaseModel):
         orm_mode = True
 
 
+class BulkPaymentRecord(BaseModel):
+    """Строка файла расчётов от процессинга (NDJSON или CSV)"""
+    external_id: str = Field(min_length=1, max_length=100)
+    user_id: int
+    subscription_id: int
+    amount: Decimal = Field(gt=0, max_digits=10, decimal_places=2)
+    payment_method: str = Field("card", max_length=20)
+
+
 class RefundRequest(BaseModel):
     reason: Optional[str] = "No reason provided"
 
@@ -143,6 +174,22 @@ class NotificationOut(BaseModel):
         orm_mode = True
 
 
+class NotificationsRead(BaseModel):
+    """Пометить прочитанными: либо список id, либо всё, созданное не позже before"""
+    ids: Optional[List[int]] = Field(None, min_length=1, max_length=1000)
+    before: Optional[UtcDatetime] = None
+
+    @model_validator(mode="after")
+    def check_one_of(self):
+        if (self.ids is None) == (self.before is None):
+            raise ValueError("Нужно передать ids или before")
+        return self
+
+
+class UnreadCount(BaseModel):
+    unread: int
+
+
 class Token(BaseModel):
     access_token: str
     token_type: str
@@ -164,16 +211,49 @@ class BalanceTransactionOut(BaseModel):
         from_attributes = True
 
 
+class MonthlyBalanceSummary(BaseModel):
+    month: date  # первое число месяца
+    topup: float
+    withdraw: float
+    operations: int
+
+
 
 class SubscriptionRequestCreate(BaseModel):
     subscription_id: int
 
+class SubscriptionRequestStatus(str, Enum):
+    pending = "pending"
+    approved = "approved"
+    rejected = "rejected"
+
+
+class SubscriptionRequestFilter(BaseModel):
+    """Отбор ожидающих заявок; пустой фильтр — все ожидающие"""
+    subscription_id: Optional[int] = None
+    created_before: Optional[UtcDatetime] = None
+
+
+class SubscriptionRequestsBulk(BaseModel):
+    action: Literal["approve", "reject"]
+    ids: Optional[List[int]] = Field(None, min_length=1, max_length=10000)
+    filter: Optional[SubscriptionRequestFilter] = None
+
+    @model_validator(mode="after")
+    def check_one_of(self):
+        if (self.ids is None) == (self.filter is None):
+            raise ValueError("Нужно передать ids или filter")
+        return self
+
+
 class SubscriptionRequestOut(BaseModel):
     id: int
     user_id: int
     subscription_id: int
     status: str
     created_at: datetime
+    user: Optional[UserOut] = None
+    subscription: Optional[SubscriptionOut] = None
 
     class Config:
         orm_mode = True
@@ -1,58 +1,320 @@
+import logging
+import multiprocessing
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
-from app.models import UserSubscription, User, Payment, Subscription, BalanceTransaction, Notification
+
+from sqlalchemy import bindparam, func, insert, or_, select, update
+
+from app.config import settings
+from app.models import UserSubscription, User, Payment, Subscription, BalanceTransaction, OutboxEvent
 from app.database import SessionLocal
-import  uuid
+from app.services.catalog_cache import catalog_cache
+from app.services.identity_cache import identity_cache, invalidate_user
+from app.services.idempotency import cleanup_idempotency_keys
+from app.services.notification_archive import archive_notifications
+from app.services.outbox import count_pending_events, dispatch_outbox, notification_event
+from app.services.payment_reconcile import count_stale_payments, reconcile_payments
+from app.services.metrics import metrics
+from app.services.pricing import effective_price
+
+logger = logging.getLogger(__name__)
 
-def auto_renew_subscriptions():
-    db = SessionLocal()
-    today = datetime.utcnow().date()
 
-    subs = db.query(UserSubscription).filter(
+def _due_renewals_filter(today):
+    """
+    Все просроченные подписки с автопродлением, а не только end_date == today:
+    после простоя догоняем пропущенные дни. Подписки, по которым сегодня уже
+    была попытка, пропускаем — повторный запуск не шлёт уведомление ещё раз
+    """
+    return (
         UserSubscription.auto_renew == True,
-        UserSubscription.end_date == today,
-        UserSubscription.is_active == True
+        UserSubscription.end_date <= today,
+        UserSubscription.is_active == True,
+        or_(UserSubscription.last_renewal_attempt.is_(None), UserSubscription.last_renewal_attempt < today),
+    )
+
+
+def _due_renewals_query(today, after_id: int, limit: int, shard: int = 0, shards: int = 1):
+    """
+    Одна выборка на пачку: подписка пользователя + каталог.
+    SKIP LOCKED — строки, уже захваченные другим воркером, пропускаем
+    """
+    query = (
+        select(
+            UserSubscription.id,
+            UserSubscription.user_id,
+            UserSubscription.end_date,
+            Subscription.id.label("subscription_id"),
+            Subscription.name,
+            Subscription.price,
+            Subscription.discount_rate,
+            Subscription.discount_until,
+            Subscription.duration_days,
+        )
+        .join(Subscription, Subscription.id == UserSubscription.subscription_id)
+        .where(*_due_renewals_filter(today), UserSubscription.id > after_id)
+    )
+    if shards > 1:
+        query = query.where(UserSubscription.user_id % shards == shard)
+
+    return (
+        query
+        .order_by(UserSubscription.id)
+        .limit(limit)
+        .with_for_update(of=UserSubscription, skip_locked=True)
+    )
+
+
+def _lock_balances(db, user_ids) -> dict:
+    """Блокируем пользователей пачки (по возрастанию id, чтобы не было дедлоков)"""
+    rows = db.execute(
+        select(User.id, User.balance)
+        .where(User.id.in_(sorted(user_ids)))
+        .order_by(User.id)
+        .with_for_update()
     ).all()
+    return {row.id: row.balance for row in rows}
 
-    for usub in subs:
-        user = db.query(User).get(usub.user_id)
-        sub = db.query(Subscription).get(usub.subscription_id)
-
-        if user.balance >= sub.price:
-            user.balance -= sub.price
-
-            usub.start_date = today
-            usub.end_date = today + timedelta(days=sub.duration_days)
-
-            db.add(BalanceTransaction(
-                user_id=user.id,
-                amount=sub.price,
-                type="withdraw",
-                description=f"Автопродление подписки #{sub.id}"
-            ))
-
-            db.add(Payment(
-                user_id=user.id,
-                subscription_id=sub.id,
-                amount=sub.price,
-                status="completed",
-                payment_method="balance",
-                external_id=f"auto_{uuid.uuid4()}",
-                created_at=datetime.utcnow()
-            ))
-
-            db.add(Notification(
-                user_id=user.id,
-                message=f"Подписка {sub.name} была автоматически продлена",
-                is_read=False,
-                created_at=datetime.utcnow()
-            ))
+
+def _renew_chunk(db, rows, today, prices) -> dict:
+    """Обработать пачку: все изменения — несколькими bulk-запросами"""
+    now = datetime.utcnow()
+    balances = _lock_balances(db, {row.user_id for row in rows})
+    amounts = prices.prices((row.subscription_id for row in rows), today)
+    charges = defaultdict(int)
+    renewed, postponed, expired, transactions, payments, notifications = [], [], [], [], [], []
+
+    for row in rows:
+        balance = balances[row.user_id]
+        price = amounts.get(row.subscription_id)
+        if price is None:
+            # подписку создали уже после снимка каталога
+            price = effective_price(row, today)
+
+        if balance >= price:
+            balances[row.user_id] = balance - price
+            charges[row.user_id] += price
+
+            renewed.append({
+                "id": row.id,
+                "start_date": today,
+                "end_date": today + timedelta(days=row.duration_days),
+                "last_renewal_attempt": today,
+            })
+            transactions.append({
+                "user_id": row.user_id,
+                "amount": price,
+                "type": "withdraw",
+                "description": f"Автопродление подписки #{row.subscription_id}",
+                "created_at": now,
+            })
+            payments.append({
+                "user_id": row.user_id,
+                "subscription_id": row.subscription_id,
+                "amount": price,
+                "status": "completed",
+                "payment_method": "balance",
+                "external_id": f"auto_{uuid.uuid4()}",
+                "created_at": now,
+            })
+            notifications.append(
+                notification_event(row.user_id, f"Подписка {row.name} была автоматически продлена", now)
+            )
         else:
-            db.add(Notification(
-                user_id=user.id,
-                message=f"Недостаточно средств для автопродления подписки {sub.name}",
-                is_read=False,
-                created_at=datetime.utcnow()
-            ))
-
-    db.commit()
-    db.close()
+            notifications.append(
+                notification_event(row.user_id, f"Недостаточно средств для автопродления подписки {row.name}", now)
+            )
+            # в день окончания подписка ещё действует; если и повторная
+            # попытка на следующий день не удалась — отключаем
+            if row.end_date < today:
+                expired.append({"id": row.id, "is_active": False, "last_renewal_attempt": today})
+            else:
+                postponed.append({"id": row.id, "last_renewal_attempt": today})
+
+    if charges:
+        users = User.__table__
+        db.execute(
+            update(users)
+            .where(users.c.id == bindparam("user_id"))
+            .values(balance=users.c.balance - bindparam("charge")),
+            [{"user_id": user_id, "charge": charge} for user_id, charge in charges.items()],
+        )
+    if renewed:
+        db.execute(update(UserSubscription), renewed)
+    if postponed:
+        db.execute(update(UserSubscription), postponed)
+    if expired:
+        db.execute(update(UserSubscription), expired)
+    if transactions:
+        db.execute(insert(BalanceTransaction), transactions)
+    if payments:
+        db.execute(insert(Payment), payments)
+    if notifications:
+        db.execute(insert(OutboxEvent), notifications)
+
+    return {"renewed": len(renewed), "insufficient_funds": len(rows) - len(renewed), "charged_users": list(charges)}
+
+
+def auto_renew_subscriptions(chunk_size: int = None, shard: int = 0, shards: int = 1) -> dict:
+    """
+    Автопродление подписок пачками по chunk_size строк.
+    Каждая пачка — отдельная транзакция: ошибка в одной пачке
+    не откатывает уже продлённые подписки, а после падения воркера
+    задачу можно просто запустить снова.
+    shard/shards — обрабатывать только подписки с user_id % shards == shard
+    """
+    chunk_size = chunk_size or settings.renewal_chunk_size
+    today = datetime.utcnow().date()
+    prices = catalog_cache.snapshot().prices
+    stats = {"shard": shard, "renewed": 0, "insufficient_funds": 0, "chunks": 0, "failed_chunks": 0}
+    job_started = time.perf_counter()
+    last_id = 0
+
+    while True:
+        started = time.perf_counter()
+        db = SessionLocal()
+        rows = None
+        try:
+            rows = db.execute(_due_renewals_query(today, last_id, chunk_size, shard, shards)).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+
+            result = _renew_chunk(db, rows, today, prices)
+            db.commit()
+        except Exception:
+            db.rollback()
+            stats["failed_chunks"] += 1
+            metrics.inc("renewal.failed_chunks")
+            logger.exception("Ошибка автопродления в пачке после id=%s", last_id)
+            if not rows:
+                # не удалась сама выборка — продвинуться дальше нельзя
+                break
+            continue
+        finally:
+            db.close()
+
+        for user_id in result["charged_users"]:
+            invalidate_user(user_id)
+
+        stats["chunks"] += 1
+        stats["renewed"] += result["renewed"]
+        stats["insufficient_funds"] += result["insufficient_funds"]
+        metrics.inc("renewal.renewed", result["renewed"])
+        metrics.inc("renewal.insufficient_funds", result["insufficient_funds"])
+        metrics.observe("renewal.chunk", time.perf_counter() - started)
+
+    stats["elapsed"] = time.perf_counter() - job_started
+    stats["per_second"] = stats["renewed"] / stats["elapsed"] if stats["elapsed"] else 0.0
+    return stats
+
+
+def _renew_shard(shard: int, shards: int, chunk_size: int) -> dict:
+    return auto_renew_subscriptions(chunk_size=chunk_size, shard=shard, shards=shards)
+
+
+def run_parallel_renewal(workers: int = None, chunk_size: int = None) -> dict:
+    """
+    Автопродление в нескольких процессах, шардирование по user_id % workers.
+    Все подписки одного пользователя попадают в один шард, поэтому воркеры
+    не конкурируют за баланс; SKIP LOCKED позволяет запускать задачу
+    одновременно на нескольких узлах
+    """
+    workers = workers or settings.renewal_workers
+    if workers <= 1:
+        shards = [auto_renew_subscriptions(chunk_size=chunk_size)]
+    else:
+        # spawn: каждый процесс создаёт свой пул соединений, а не наследует его
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            futures = [pool.submit(_renew_shard, shard, workers, chunk_size) for shard in range(workers)]
+            shards = [future.result() for future in futures]
+
+        # метрики и кэш дочерних процессов до нас не доходят
+        for shard_stats in shards:
+            metrics.inc("renewal.renewed", shard_stats["renewed"])
+            metrics.inc("renewal.insufficient_funds", shard_stats["insufficient_funds"])
+        identity_cache.clear()
+
+    for shard_stats in shards:
+        logger.info(
+            "Шард %s: продлено %s за %.1f с (%.0f/с)",
+            shard_stats["shard"], shard_stats["renewed"], shard_stats["elapsed"], shard_stats["per_second"],
+        )
+
+    return {
+        "shards": shards,
+        "renewed": sum(s["renewed"] for s in shards),
+        "insufficient_funds": sum(s["insufficient_funds"] for s in shards),
+    }
+
+
+def count_due_renewals() -> int:
+    db = SessionLocal()
+    try:
+        today = datetime.utcnow().date()
+        return db.scalar(select(func.count()).select_from(UserSubscription).where(*_due_renewals_filter(today)))
+    finally:
+        db.close()
+
+
+def expire_subscriptions() -> int:
+    """
+    Отключить истёкшие подписки одним UPDATE.
+    Подписки с автопродлением отключает сама задача автопродления
+    """
+    today = datetime.utcnow().date()
+    db = SessionLocal()
+    try:
+        result = db.execute(
+            update(UserSubscription)
+            .where(
+                UserSubscription.is_active == True,
+                UserSubscription.end_date < today,
+                UserSubscription.auto_renew == False,
+            )
+            .values(is_active=False)
+        )
+        db.commit()
+        return result.rowcount
+    finally:
+        db.close()
+
+
+def register_jobs(scheduler) -> None:
+    scheduler.register(
+        "auto_renew",
+        run_parallel_renewal,
+        interval=settings.renewal_interval_seconds,
+        backlog=count_due_renewals,
+    )
+    scheduler.register(
+        "expire_subscriptions",
+        expire_subscriptions,
+        interval=settings.expiry_interval_seconds,
+    )
+    scheduler.register(
+        "notification_archive",
+        archive_notifications,
+        interval=settings.notification_cleanup_interval_seconds,
+    )
+    scheduler.register(
+        "outbox_dispatch",
+        dispatch_outbox,
+        interval=settings.outbox_dispatch_interval_seconds,
+        backlog=count_pending_events,
+    )
+    scheduler.register(
+        "payment_reconcile",
+        reconcile_payments,
+        interval=settings.payment_reconcile_interval_seconds,
+        backlog=count_stale_payments,
+    )
+    scheduler.register(
+        "idempotency_cleanup",
+        cleanup_idempotency_keys,
+        interval=settings.idempotency_cleanup_interval_seconds,
+    )
@@ -0,0 +1,179 @@
+"""
+Кэш каталога подписок в памяти процесса.
+
+Каталог меняется только админскими create/update/delete, а читается на
+каждом открытии страницы. Весь каталог загружается одним запросом,
+готовые ответы (JSON + ETag) запоминаются для снимка, поэтому повторный
+запрос и If-None-Match не трогают ни Postgres, ни сериализацию.
+
+Версия каталога — строка catalog_version. Изменение каталога увеличивает
+её в своей же транзакции и рассылает новый номер через pg_notify; каждый
+воркер слушает канал (см. NotificationHub) и отбрасывает снимок, если его
+версия меньше полученной. Снимок читает версию и строки в одной
+транзакции REPEATABLE READ, поэтому версия всегда соответствует строкам:
+незакоммиченное изменение не видно ни в версии, ни в строках. Если LISTEN
+не работает, снимок всё равно живёт не дольше catalog_cache_ttl_seconds
+"""
+import hashlib
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from typing import Dict, List, Optional
+
+from fastapi import Response
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models import CatalogVersion, Subscription
+from app.schemas import SubscriptionOut
+from app.services.metrics import metrics
+from app.services.pricing import PriceTable
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "catalog"
+
+
+@dataclass(frozen=True)
+class CachedResponse:
+    body: bytes
+    etag: str
+
+
+@dataclass
+class CatalogSnapshot:
+    version: int
+    loaded_at: float
+    day: date  # effective_price в items посчитан на этот день (UTC)
+    items: List[SubscriptionOut]
+    by_id: Dict[int, SubscriptionOut]
+    prices: PriceTable
+    responses: Dict[tuple, CachedResponse] = field(default_factory=dict)
+
+
+def notify_catalog_changed(db) -> int:
+    """
+    Новая версия каталога + pg_notify в текущей транзакции (разошлётся после
+    коммита). Строка версии блокируется до коммита, так что изменения
+    каталога получают версии в порядке коммитов
+    """
+    statement = insert(CatalogVersion).values(id=1, version=1)
+    version = db.scalar(
+        statement.on_conflict_do_update(
+            index_elements=[CatalogVersion.id],
+            set_={"version": CatalogVersion.version + 1},
+        ).returning(CatalogVersion.version)
+    )
+    db.execute(select(func.pg_notify(CHANNEL, str(version))))
+    return version
+
+
+class CatalogCache:
+    def __init__(self, ttl: float, max_responses: int):
+        self.ttl = ttl
+        self.max_responses = max_responses
+        self.latest_version = 0  # наибольшая версия, о которой знает процесс
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._lock = threading.Lock()
+
+    def _fresh(self, snapshot: Optional[CatalogSnapshot]) -> bool:
+        return (
+            snapshot is not None
+            and snapshot.version >= self.latest_version
+            and time.monotonic() - snapshot.loaded_at < self.ttl
+            and snapshot.day == datetime.utcnow().date()
+        )
+
+    def _load(self) -> CatalogSnapshot:
+        db = SessionLocal()
+        try:
+            # версия и строки — из одного снимка базы
+            db.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+            version = db.scalar(select(CatalogVersion.version).where(CatalogVersion.id == 1)) or 0
+            rows = db.scalars(select(Subscription).order_by(Subscription.id)).all()
+        finally:
+            db.close()
+
+        today = datetime.utcnow().date()
+        prices = PriceTable(rows, today, settings.pricing_table_days)
+        items = []
+        for row in rows:
+            item = SubscriptionOut.model_validate(row)
+            item.effective_price = float(prices.price(row.id, today))
+            items.append(item)
+        return CatalogSnapshot(
+            version=version,
+            loaded_at=time.monotonic(),
+            day=today,
+            items=items,
+            by_id={item.id: item for item in items},
+            prices=prices,
+        )
+
+    def snapshot(self) -> CatalogSnapshot:
+        snapshot = self._snapshot
+        if self._fresh(snapshot):
+            metrics.inc("catalog.cache.hits")
+            return snapshot
+
+        with self._lock:
+            # другой поток мог уже перезагрузить каталог, пока мы ждали
+            snapshot = self._snapshot
+            if self._fresh(snapshot):
+                return snapshot
+            metrics.inc("catalog.cache.misses")
+            snapshot = self._load()
+            self.latest_version = max(self.latest_version, snapshot.version)
+            self._snapshot = snapshot
+            return snapshot
+
+    def invalidate(self, version: int) -> None:
+        with self._lock:
+            if version > self.latest_version:
+                self.latest_version = version
+
+    def on_notify(self, connection, pid, channel, payload) -> None:
+        try:
+            self.invalidate(int(payload))
+        except ValueError:
+            logger.warning("Некорректная версия каталога: %r", payload)
+
+    def render(self, snapshot: CatalogSnapshot, key: tuple, build) -> CachedResponse:
+        """Готовый ответ для ключа запроса; build() вызывается один раз на снимок"""
+        cached = snapshot.responses.get(key)
+        if cached is None:
+            body = build()
+            cached = CachedResponse(body=body, etag=f'"{snapshot.version}-{hashlib.sha256(body).hexdigest()[:32]}"')
+            if len(snapshot.responses) < self.max_responses:
+                snapshot.responses[key] = cached
+        return cached
+
+
+def _matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # для If-None-Match сравнение слабое: W/"x" совпадает с "x"
+    return etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+
+
+def catalog_response(cached: CachedResponse, if_none_match: Optional[str]) -> Response:
+    headers = {
+        "ETag": cached.etag,
+        "Cache-Control": f"public, max-age={settings.catalog_http_max_age_seconds}, must-revalidate",
+    }
+    if _matches(if_none_match, cached.etag):
+        metrics.inc("catalog.not_modified")
+        return Response(status_code=304, headers=headers)
+    return Response(content=cached.body, media_type="application/json", headers=headers)
+
+
+catalog_cache = CatalogCache(
+    ttl=settings.catalog_cache_ttl_seconds,
+    max_responses=settings.catalog_cache_max_responses,
+)
@@ -0,0 +1,101 @@
+"""
+Потоковая выгрузка платежей и операций по балансу (CSV или NDJSON).
+
+Строки читаются серверным курсором (stream_results) пачками по
+export_batch_size и сразу превращаются в байты, поэтому память не
+зависит от размера таблицы. Запрос выбирает только колонки — ORM-объекты
+не создаются. По желанию результат сжимается gzip на лету
+"""
+import csv
+import enum
+import io
+import json
+import zlib
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Iterator, Optional
+
+from sqlalchemy import select
+
+from app.config import settings
+from app.database import engine
+from app.models import BalanceTransaction, Payment
+
+FORMATS = ("csv", "ndjson")
+
+# имя выгрузки -> модель и колонки в порядке вывода
+EXPORTS = {
+    "payments": (Payment, (
+        "id", "user_id", "subscription_id", "amount", "status", "payment_method",
+        "external_id", "created_at", "is_refunded", "refund_reason",
+    )),
+    "balance-transactions": (BalanceTransaction, (
+        "id", "user_id", "amount", "type", "description", "created_at",
+    )),
+}
+
+
+def export_query(name: str, date_from: Optional[date] = None, date_to: Optional[date] = None,
+                 user_id: Optional[int] = None):
+    """SELECT нужных колонок по порядку id; date_to — включительно"""
+    model, columns = EXPORTS[name]
+    query = select(*(getattr(model, column) for column in columns)).order_by(model.id)
+    if date_from:
+        query = query.where(model.created_at >= date_from)
+    if date_to:
+        query = query.where(model.created_at < date_to + timedelta(days=1))
+    if user_id is not None:
+        query = query.where(model.user_id == user_id)
+    return query
+
+
+def _plain(value):
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def _csv_chunk(rows, header=None) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(header)
+    writer.writerows([_plain(value) for value in row] for row in rows)
+    return buffer.getvalue()
+
+
+def _ndjson_chunk(rows, columns) -> str:
+    return "".join(
+        json.dumps(dict(zip(columns, map(_plain, row))), ensure_ascii=False) + "\n" for row in rows
+    )
+
+
+def stream_export(query, fmt: str, gzip: bool = False, batch_size: int = None) -> Iterator[bytes]:
+    """Байты выгрузки по мере чтения пачек из серверного курсора"""
+    if fmt not in FORMATS:
+        raise ValueError(f"Неизвестный формат: {fmt}")
+    batch_size = batch_size or settings.export_batch_size
+    # wbits=31 — формат gzip (заголовок и контрольная сумма), а не голый deflate
+    compressor = zlib.compressobj(wbits=31) if gzip else None
+
+    def encode(text: str) -> bytes:
+        data = text.encode("utf-8")
+        return compressor.compress(data) if compressor else data
+
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(query)
+        columns = list(result.keys())
+        if fmt == "csv":
+            yield encode(_csv_chunk((), header=columns))
+        for rows in result.partitions():
+            chunk = _csv_chunk(rows) if fmt == "csv" else _ndjson_chunk(rows, columns)
+            data = encode(chunk)
+            if data:
+                yield data
+
+    if compressor:
+        yield compressor.flush()
@@ -0,0 +1,234 @@
+"""
+Заголовок Idempotency-Key для запросов, которые двигают деньги.
+
+Ответ сохраняется в idempotency_keys в той же транзакции, что и сама
+операция: либо закоммичено и то и другое, либо ничего. Повтор запроса
+с тем же ключом получает сохранённый ответ, обработчик не выполняется.
+Перед таблицей — LRU-кэш процесса, чтобы повтор не ходил в БД.
+
+Если два одинаковых запроса пришли одновременно, второй упрётся
+в уникальный индекс (user_id, key) при коммите, его транзакция
+откатится, и он вернёт ответ первого.
+
+Это не работает, если до записи ответа операция уже закоммичена или
+ушла во внешнюю систему (оплата через провайдера). Тогда ключ занимается
+заранее (reserve) — строкой без ответа в одной транзакции с операцией.
+Повтор, пока ответа нет, получает 409; если обработчик упал после
+reserve, ключ так и остаётся «в работе», итог виден по самой операции
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Optional
+
+from fastapi import HTTPException, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import delete, null, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models import IdempotencyKey
+from app.services.metrics import metrics
+
+
+@dataclass(frozen=True)
+class StoredResponse:
+    endpoint: str
+    fingerprint: str
+    status_code: Optional[int]  # None — запрос ещё выполняется
+    body: object
+
+
+class ResponseCache:
+    """LRU (user_id, key) -> StoredResponse. TTL — срок хранения ключей в БД"""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._items: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int, key: str) -> Optional[StoredResponse]:
+        with self._lock:
+            item = self._items.get((user_id, key))
+            if item is None:
+                return None
+            expires_at, stored = item
+            if expires_at <= time.monotonic():
+                del self._items[(user_id, key)]
+                return None
+            self._items.move_to_end((user_id, key))
+            return stored
+
+    def set(self, user_id: int, key: str, stored: StoredResponse) -> None:
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._items[(user_id, key)] = (time.monotonic() + self.ttl, stored)
+            self._items.move_to_end((user_id, key))
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+
+response_cache = ResponseCache(
+    max_size=settings.idempotency_cache_size,
+    ttl=settings.idempotency_retention_hours * 3600,
+)
+
+
+@dataclass
+class IdempotentRequest:
+    user_id: int
+    key: Optional[str]  # None — заголовок не передан, запрос выполняется как обычно
+    endpoint: str
+    fingerprint: str
+    reserved: bool = False
+
+    @classmethod
+    def create(cls, key: Optional[str], user_id: int, endpoint: str, payload=None) -> "IdempotentRequest":
+        if key is not None and not 0 < len(key) <= 255:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Некорректный Idempotency-Key")
+        body = json.dumps(jsonable_encoder(payload), sort_keys=True)
+        return cls(
+            user_id=user_id,
+            key=key,
+            endpoint=endpoint,
+            fingerprint=hashlib.sha256(body.encode()).hexdigest(),
+        )
+
+    async def _load(self, db: AsyncSession) -> Optional[StoredResponse]:
+        stored = response_cache.get(self.user_id, self.key)
+        if stored is not None:
+            return stored
+
+        row = await db.scalar(
+            select(IdempotencyKey).where(IdempotencyKey.user_id == self.user_id, IdempotencyKey.key == self.key)
+        )
+        if row is None:
+            return None
+        stored = StoredResponse(row.endpoint, row.fingerprint, row.status_code, row.response)
+        if stored.status_code is not None:
+            # ключ «в работе» не кэшируем — ответ вот-вот появится
+            response_cache.set(self.user_id, self.key, stored)
+        return stored
+
+    def _respond(self, stored: StoredResponse) -> JSONResponse:
+        if (stored.endpoint, stored.fingerprint) != (self.endpoint, self.fingerprint):
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="Idempotency-Key уже использован для другого запроса",
+            )
+        if stored.status_code is None:
+            metrics.inc("idempotency.in_progress")
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Запрос с этим Idempotency-Key ещё выполняется",
+            )
+        metrics.inc("idempotency.replayed")
+        return JSONResponse(content=stored.body, status_code=stored.status_code)
+
+    async def replay(self, db: AsyncSession) -> Optional[JSONResponse]:
+        """Сохранённый ответ, если запрос с этим ключом уже выполнялся"""
+        if self.key is None:
+            return None
+        stored = await self._load(db)
+        return self._respond(stored) if stored is not None else None
+
+    async def _commit_new(self, db: AsyncSession, status_code: Optional[int], body) -> Optional[JSONResponse]:
+        db.add(IdempotencyKey(
+            user_id=self.user_id,
+            key=self.key,
+            endpoint=self.endpoint,
+            fingerprint=self.fingerprint,
+            status_code=status_code,
+            response=null() if body is None else body,  # SQL NULL, а не JSON null
+            created_at=datetime.utcnow(),
+        ))
+        try:
+            await db.commit()
+        except IntegrityError:
+            await db.rollback()
+            stored = await self._load(db)
+            if stored is None:
+                raise
+            metrics.inc("idempotency.conflicts")
+            return self._respond(stored)
+        return None
+
+    async def reserve(self, db: AsyncSession) -> Optional[JSONResponse]:
+        """
+        Занять ключ строкой без ответа и закоммитить её вместе с операцией —
+        до вызова внешней системы. Если ключ уже занят, операция
+        откатывается и возвращается ответ первого запроса (или 409)
+        """
+        if self.key is None:
+            await db.commit()
+            return None
+
+        replayed = await self._commit_new(db, None, None)
+        if replayed:
+            return replayed
+        self.reserved = True
+        return None
+
+    async def commit(self, db: AsyncSession, body, status_code: int = 200) -> Optional[JSONResponse]:
+        """
+        Записать ответ вместе с операцией и закоммитить транзакцию.
+        Возвращает ответ параллельного запроса, если тот успел раньше
+        (тогда наша операция откатывается)
+        """
+        if self.key is None:
+            await db.commit()
+            return None
+
+        body = jsonable_encoder(body)
+        if self.reserved:
+            await db.execute(
+                update(IdempotencyKey)
+                .where(IdempotencyKey.user_id == self.user_id, IdempotencyKey.key == self.key)
+                .values(status_code=status_code, response=body)
+            )
+            await db.commit()
+        else:
+            replayed = await self._commit_new(db, status_code, body)
+            if replayed:
+                return replayed
+
+        response_cache.set(self.user_id, self.key, StoredResponse(self.endpoint, self.fingerprint, status_code, body))
+        return None
+
+
+def cleanup_idempotency_keys(chunk_size: int = None) -> int:
+    """Удалить ключи старше срока хранения, короткими транзакциями"""
+    chunk_size = chunk_size or settings.renewal_chunk_size
+    cutoff = datetime.utcnow() - timedelta(hours=settings.idempotency_retention_hours)
+    deleted = 0
+
+    while True:
+        db = SessionLocal()
+        try:
+            ids = (
+                select(IdempotencyKey.id)
+                .where(IdempotencyKey.created_at < cutoff)
+                .limit(chunk_size)
+                .with_for_update(skip_locked=True)
+            )
+            result = db.execute(delete(IdempotencyKey).where(IdempotencyKey.id.in_(ids.scalar_subquery())))
+            db.commit()
+        finally:
+            db.close()
+
+        deleted += result.rowcount
+        if result.rowcount < chunk_size:
+            return deleted
@@ -0,0 +1,91 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Optional
+
+from app.config import settings
+
+
+@dataclass(frozen=True)
+class CachedUser:
+    """Снимок пользователя для авторизации (не привязан к сессии БД)"""
+    id: int
+    username: str
+    email: str
+    role: str
+    balance: Decimal
+
+    @classmethod
+    def from_model(cls, user) -> "CachedUser":
+        return cls(
+            id=user.id,
+            username=user.username,
+            email=user.email,
+            role=user.role,
+            balance=user.balance,
+        )
+
+
+class IdentityCache:
+    """
+    Ограниченный LRU-кэш с TTL: user_id -> CachedUser.
+    Счётчик generation защищает от записи устаревших данных,
+    если пользователь был изменён, пока мы читали его из БД.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.generation = 0
+        self._items: "OrderedDict[int, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0 and self.ttl > 0
+
+    def get(self, user_id: int) -> Optional[CachedUser]:
+        if not self.enabled:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            item = self._items.get(user_id)
+            if item is None:
+                return None
+            expires_at, user = item
+            if expires_at <= now:
+                del self._items[user_id]
+                return None
+            self._items.move_to_end(user_id)
+            return user
+
+    def set(self, user: CachedUser, generation: int) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._items[user.id] = (time.monotonic() + self.ttl, user)
+            self._items.move_to_end(user.id)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            self.generation += 1
+            self._items.pop(user_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.generation += 1
+            self._items.clear()
+
+
+identity_cache = IdentityCache(max_size=settings.auth_cache_max_size, ttl=settings.auth_cache_ttl_seconds)
+
+
+def invalidate_user(user_id: int) -> None:
+    """Сбросить кэш пользователя после изменения роли, баланса или учётных данных"""
+    identity_cache.invalidate(user_id)
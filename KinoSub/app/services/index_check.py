@@ -0,0 +1,144 @@
+"""
+Проверка через EXPLAIN, что горячие запросы роутеров и фоновых задач
+идут по индексам, а не полным сканированием таблиц.
+
+По умолчанию seq scan выключается (enable_seqscan = off): на маленькой
+тестовой базе планировщик и так выберет полный проход, а нам важно,
+что подходящий индекс вообще существует
+"""
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select, text, update
+
+from app.database import engine
+from app.models import (
+    BalanceTransaction,
+    Notification,
+    OutboxEvent,
+    Payment,
+    SubscriptionRequest,
+    User,
+    UserSubscription,
+)
+from app.services.background import _due_renewals_query
+from app.services.payment_reconcile import _stale_pending_query
+
+INDEX_NODES = {"Index Scan", "Index Only Scan", "Bitmap Index Scan", "Bitmap Heap Scan"}
+
+
+def hot_queries():
+    """(название, запрос, таблица, которая должна читаться по индексу)"""
+    today = datetime.utcnow().date()
+    return [
+        ("auth: пользователь по id", select(User).where(User.id == 1), "users"),
+        ("login: пользователь по username", select(User).where(User.username == "user"), "users"),
+        (
+            "GET /payments/",
+            select(Payment).where(Payment.user_id == 1)
+            .order_by(Payment.created_at.desc(), Payment.id.desc()).limit(100),
+            "payments",
+        ),
+        (
+            "POST /payments/: подписка пользователя",
+            select(UserSubscription).where(UserSubscription.user_id == 1, UserSubscription.subscription_id == 1),
+            "user_subscriptions",
+        ),
+        (
+            "GET /notifications/",
+            select(Notification).where(Notification.user_id == 1)
+            .order_by(Notification.created_at.desc(), Notification.id.desc()).limit(100),
+            "notifications",
+        ),
+        (
+            "GET /notifications/unread-count",
+            select(func.count()).select_from(Notification)
+            .where(Notification.user_id == 1, Notification.is_read == False),
+            "notifications",
+        ),
+        (
+            "GET /wallet/history",
+            select(BalanceTransaction).where(BalanceTransaction.user_id == 1)
+            .order_by(BalanceTransaction.created_at.desc(), BalanceTransaction.id.desc()).limit(100),
+            "balance_transactions",
+        ),
+        (
+            "POST /subscription-requests/: проверка ожидающей заявки",
+            select(SubscriptionRequest).filter_by(user_id=1, subscription_id=1, status="pending"),
+            "subscription_requests",
+        ),
+        (
+            "GET /subscription-requests/admin: очередь",
+            select(SubscriptionRequest).where(SubscriptionRequest.status == "pending")
+            .order_by(SubscriptionRequest.created_at, SubscriptionRequest.id).limit(50),
+            "subscription_requests",
+        ),
+        (
+            "GET /subscription-requests/admin: история",
+            select(SubscriptionRequest).where(SubscriptionRequest.status == "approved")
+            .order_by(SubscriptionRequest.created_at.desc(), SubscriptionRequest.id.desc()).limit(50),
+            "subscription_requests",
+        ),
+        ("автопродление", _due_renewals_query(today, 0, 1000), "user_subscriptions"),
+        (
+            "сверка pending-платежей",
+            _stale_pending_query(datetime.utcnow() - timedelta(minutes=5), 0, 100),
+            "payments",
+        ),
+        (
+            "отключение истёкших",
+            update(UserSubscription)
+            .where(
+                UserSubscription.is_active == True,
+                UserSubscription.end_date < today,
+                UserSubscription.auto_renew == False,
+            )
+            .values(is_active=False),
+            "user_subscriptions",
+        ),
+        (
+            "архивация уведомлений по сроку",
+            select(Notification.id).where(
+                Notification.is_read == True,
+                Notification.created_at < datetime.utcnow() - timedelta(days=90),
+            ),
+            "notifications",
+        ),
+        (
+            "диспетчер outbox",
+            select(OutboxEvent)
+            .where(OutboxEvent.status == "pending", OutboxEvent.available_at <= datetime.utcnow())
+            .order_by(OutboxEvent.available_at, OutboxEvent.id).limit(500),
+            "outbox_events",
+        ),
+    ]
+
+
+def _scans(plan: dict, table: str):
+    """Типы узлов плана, читающих указанную таблицу (ModifyTable не в счёт)"""
+    if plan.get("Relation Name") == table and plan["Node Type"].endswith("Scan"):
+        yield plan["Node Type"]
+    for child in plan.get("Plans", []):
+        yield from _scans(child, table)
+
+
+def check_indexes(allow_seqscan: bool = False) -> list:
+    results = []
+    with engine.connect() as conn:
+        if not allow_seqscan:
+            conn.execute(text("SET enable_seqscan = off"))
+
+        for name, statement, table in hot_queries():
+            compiled = statement.compile(dialect=conn.dialect)
+            plan = conn.exec_driver_sql(
+                "EXPLAIN (FORMAT JSON) " + compiled.string, compiled.params
+            ).scalar()[0]["Plan"]
+            scans = list(_scans(plan, table))
+            results.append({
+                "query": name,
+                "table": table,
+                "scans": scans,
+                "ok": bool(scans) and all(scan in INDEX_NODES for scan in scans),
+            })
+
+        conn.rollback()
+    return results
@@ -0,0 +1,87 @@
+"""
+Изменение баланса пользователя без чтения его в Python.
+
+Каждая операция — один запрос:
+
+    WITH updated AS (
+        UPDATE users SET balance = balance - :x
+        WHERE id = :id AND balance >= :x
+        RETURNING id, balance
+    ), inserted AS (
+        INSERT INTO balance_transactions (...) SELECT ... FROM updated RETURNING id
+    )
+    SELECT updated.balance, inserted.id FROM updated, inserted
+
+Строка пользователя блокируется только на время этого UPDATE (до конца
+транзакции вызывающего), параллельные запросы не теряют изменения,
+а недостаток средств проверяется самой базой
+"""
+from datetime import datetime
+from decimal import Decimal
+
+from sqlalchemy import insert, literal, select, true, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import BalanceTransaction, TransactionType, User
+from app.services.metrics import metrics
+
+
+class InsufficientFunds(Exception):
+    """Недостаточно средств (или пользователь не найден)"""
+
+
+def _mutation(user_id: int, amount: Decimal, type: TransactionType, description: str):
+    users = User.__table__
+    transactions = BalanceTransaction.__table__
+    amount = literal(amount, users.c.balance.type)
+
+    if type == TransactionType.withdraw:
+        updated = (
+            update(users)
+            .where(users.c.id == user_id, users.c.balance >= amount)
+            .values(balance=users.c.balance - amount)
+        )
+    else:
+        updated = update(users).where(users.c.id == user_id).values(balance=users.c.balance + amount)
+    updated = updated.returning(users.c.id, users.c.balance).cte("updated")
+
+    inserted = (
+        insert(transactions)
+        .from_select(
+            ["user_id", "amount", "type", "description", "created_at"],
+            select(
+                updated.c.id,
+                amount,
+                literal(type, transactions.c.type.type),
+                literal(description, transactions.c.description.type),
+                literal(datetime.utcnow(), transactions.c.created_at.type),
+            ),
+        )
+        .returning(transactions.c.id)
+        .cte("inserted")
+    )
+
+    return select(updated.c.balance, inserted.c.id.label("transaction_id")).select_from(updated.join(inserted, true()))
+
+
+async def _apply(db: AsyncSession, user_id: int, amount: Decimal, type: TransactionType, description: str) -> Decimal:
+    if amount <= 0:
+        raise ValueError("Сумма операции должна быть больше 0")
+
+    row = (await db.execute(_mutation(user_id, Decimal(str(amount)), type, description))).first()
+    if row is None:
+        metrics.inc("ledger.insufficient_funds")
+        raise InsufficientFunds()
+
+    metrics.inc(f"ledger.{type.value}")
+    return row.balance
+
+
+async def credit(db: AsyncSession, user_id: int, amount: Decimal, description: str) -> Decimal:
+    """Зачислить amount, вернуть новый баланс. Коммит — за вызывающим"""
+    return await _apply(db, user_id, amount, TransactionType.topup, description)
+
+
+async def debit(db: AsyncSession, user_id: int, amount: Decimal, description: str) -> Decimal:
+    """Списать amount, если хватает средств, иначе InsufficientFunds. Коммит — за вызывающим"""
+    return await _apply(db, user_id, amount, TransactionType.withdraw, description)
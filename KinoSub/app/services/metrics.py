@@ -0,0 +1,65 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List
+
+
+class Metrics:
+    """Простой in-process реестр метрик: счётчики, gauge и тайминги"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = {}
+        self._gauges: Dict[str, float] = {}
+        self._timings: Dict[str, list] = {}  # name -> [count, total, max]
+        self._collectors: List[Callable[[], Dict[str, float]]] = []
+
+    def inc(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def set_gauge(self, name: str, value: float) -> None:
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name: str, seconds: float) -> None:
+        with self._lock:
+            timing = self._timings.setdefault(name, [0, 0.0, 0.0])
+            timing[0] += 1
+            timing[1] += seconds
+            timing[2] = max(timing[2], seconds)
+
+    @contextmanager
+    def timer(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started)
+
+    def register_collector(self, collector: Callable[[], Dict[str, float]]) -> None:
+        """Функция, которая вычисляет gauge-значения в момент снятия метрик"""
+        self._collectors.append(collector)
+
+    def snapshot(self) -> dict:
+        gauges = {}
+        for collector in self._collectors:
+            gauges.update(collector())
+
+        with self._lock:
+            gauges.update(self._gauges)
+            return {
+                "counters": dict(self._counters),
+                "gauges": gauges,
+                "timings": {
+                    name: {
+                        "count": count,
+                        "avg": total / count if count else 0.0,
+                        "max": max_value,
+                    }
+                    for name, (count, total, max_value) in self._timings.items()
+                },
+            }
+
+
+metrics = Metrics()
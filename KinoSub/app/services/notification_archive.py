@@ -0,0 +1,153 @@
+"""
+Хранение уведомлений: горячая таблица notifications держит только свежие,
+остальное переносится в notifications_archive.
+
+Политика (настройки notification_*):
+    - прочитанные уведомления старше notification_retention_days;
+    - прочитанные сверх notification_keep_per_user последних у пользователя
+      (0 — без ограничения).
+Непрочитанные не архивируются никогда. Перенос — пачками по
+notification_archive_chunk_size: DELETE ... RETURNING и INSERT в архив одним
+запросом, каждая пачка в своей короткой транзакции. Строки, заблокированные
+пользователем (отметка о прочтении), пропускаются через SKIP LOCKED и уйдут
+при следующем запуске.
+
+Архив хранится notification_archive_retention_days (0 — бессрочно)
+"""
+import logging
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import Integer, DateTime, column, delete, insert, select, true, tuple_, values
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models import Notification, NotificationArchive, User
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+USERS_PER_GROUP = 1000
+
+
+def _move_chunk(db, conditions: list, chunk_size: int) -> int:
+    """Перенести в архив до chunk_size прочитанных уведомлений, подходящих под условия"""
+    ids = (
+        select(Notification.id)
+        .where(Notification.is_read == True, *conditions)
+        .limit(chunk_size)
+        .with_for_update(of=Notification, skip_locked=True)
+        .correlate(None)  # подзапрос самостоятельный, иначе notifications «уйдёт» во внешний DELETE
+    )
+    moved = (
+        delete(Notification)
+        .where(Notification.id.in_(ids.scalar_subquery()))
+        .returning(Notification.id, Notification.user_id, Notification.message, Notification.created_at)
+        .cte("moved")
+    )
+    result = db.execute(
+        insert(NotificationArchive).from_select(
+            ["id", "user_id", "message", "created_at"],
+            select(moved.c.id, moved.c.user_id, moved.c.message, moved.c.created_at),
+        )
+    )
+    return result.rowcount
+
+
+def _move(conditions: list, chunk_size: int) -> int:
+    moved = 0
+    while True:
+        db = SessionLocal()
+        try:
+            count = _move_chunk(db, conditions, chunk_size)
+            db.commit()
+        finally:
+            db.close()
+
+        moved += count
+        if count < chunk_size:
+            return moved
+
+
+def _keep_boundaries(keep: int) -> list:
+    """
+    Для каждого пользователя, у которого больше keep уведомлений, —
+    (user_id, created_at, id) его keep-го по свежести уведомления.
+    Всё, что старше, подлежит архивации. По индексу (user_id, created_at, id)
+    """
+    nth = (
+        select(Notification.created_at, Notification.id)
+        .where(Notification.user_id == User.id)
+        .order_by(Notification.created_at.desc(), Notification.id.desc())
+        .offset(keep - 1)
+        .limit(1)
+        .lateral("nth")
+    )
+    db = SessionLocal()
+    try:
+        return db.execute(select(User.id, nth.c.created_at, nth.c.id).join(nth, true())).all()
+    finally:
+        db.close()
+
+
+def _archive_over_limit(keep: int, chunk_size: int) -> int:
+    boundaries = _keep_boundaries(keep)
+    moved = 0
+    for start in range(0, len(boundaries), USERS_PER_GROUP):
+        boundary = values(
+            column("user_id", Integer),
+            column("created_at", DateTime),
+            column("id", Integer),
+            name="boundary",
+        ).data([tuple(row) for row in boundaries[start:start + USERS_PER_GROUP]])
+        moved += _move(
+            [
+                Notification.user_id == boundary.c.user_id,
+                tuple_(Notification.created_at, Notification.id) < tuple_(boundary.c.created_at, boundary.c.id),
+            ],
+            chunk_size,
+        )
+    return moved
+
+
+def purge_archive(chunk_size: int) -> int:
+    """Удалить из архива записи старше notification_archive_retention_days"""
+    if not settings.notification_archive_retention_days:
+        return 0
+    cutoff = datetime.utcnow() - timedelta(days=settings.notification_archive_retention_days)
+    deleted = 0
+    while True:
+        db = SessionLocal()
+        try:
+            ids = (
+                select(NotificationArchive.id)
+                .where(NotificationArchive.archived_at < cutoff)
+                .limit(chunk_size)
+            )
+            result = db.execute(delete(NotificationArchive).where(NotificationArchive.id.in_(ids.scalar_subquery())))
+            db.commit()
+        finally:
+            db.close()
+
+        deleted += result.rowcount
+        if result.rowcount < chunk_size:
+            return deleted
+
+
+def archive_notifications(chunk_size: int = None) -> dict:
+    """Применить политику хранения уведомлений (задача планировщика и CLI)"""
+    chunk_size = chunk_size or settings.notification_archive_chunk_size
+    started = time.perf_counter()
+    stats = {"by_age": 0, "over_limit": 0, "purged": 0}
+
+    if settings.notification_retention_days:
+        cutoff = datetime.utcnow() - timedelta(days=settings.notification_retention_days)
+        stats["by_age"] = _move([Notification.created_at < cutoff], chunk_size)
+    if settings.notification_keep_per_user:
+        stats["over_limit"] = _archive_over_limit(settings.notification_keep_per_user, chunk_size)
+    stats["purged"] = purge_archive(chunk_size)
+
+    metrics.inc("notifications.archived", stats["by_age"] + stats["over_limit"])
+    metrics.inc("notifications.archive.purged", stats["purged"])
+    logger.info("Архивация уведомлений за %.1f с: %s", time.perf_counter() - started, stats)
+    return stats
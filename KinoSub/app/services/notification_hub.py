@@ -0,0 +1,144 @@
+"""
+Доставка новых уведомлений открытым потокам /notifications/stream.
+
+Диспетчер outbox, записав уведомления, вызывает pg_notify в той же
+транзакции — Postgres разошлёт их после коммита. Каждый процесс uvicorn
+держит одно соединение с LISTEN и раздаёт уведомления своим подписчикам
+через очереди в памяти. Так уведомление доходит до клиента, к какому бы
+воркеру он ни был подключён
+"""
+import asyncio
+import json
+import logging
+from collections import defaultdict
+from typing import Dict, List, Set
+
+import asyncpg
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+
+from app.config import settings
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "notifications"
+MAX_PAYLOAD_BYTES = 7900  # предел pg_notify — 8000 байт
+
+
+class TooManyConnections(Exception):
+    def __init__(self, detail: str, status_code: int):
+        super().__init__(detail)
+        self.detail = detail
+        self.status_code = status_code
+
+
+def publish_notifications(db, notifications: List[dict]) -> None:
+    """pg_notify для пачки уведомлений одним запросом (синхронная сессия, до коммита)"""
+    payloads = []
+    for notification in notifications:
+        payload = json.dumps(jsonable_encoder(notification), ensure_ascii=False)
+        if len(payload.encode()) <= MAX_PAYLOAD_BYTES:
+            payloads.append(payload)
+    if payloads:
+        db.execute(
+            text("SELECT pg_notify(:channel, payload) FROM unnest(CAST(:payloads AS text[])) AS payload"),
+            {"channel": CHANNEL, "payloads": payloads},
+        )
+
+
+class NotificationHub:
+    def __init__(self, max_connections: int, max_per_user: int, queue_size: int):
+        self.max_connections = max_connections
+        self.max_per_user = max_per_user
+        self.queue_size = queue_size
+        self._subscribers: Dict[int, Set[asyncio.Queue]] = defaultdict(set)
+        self._connections = 0
+        self._listener: asyncio.Task = None
+        self._channels = {CHANNEL: self._on_notify}
+
+    def check(self, user_id: int) -> None:
+        """TooManyConnections, если новый поток сейчас не поместится (место не занимает)"""
+        if self._connections >= self.max_connections:
+            metrics.inc("notifications.stream.rejected")
+            raise TooManyConnections("Слишком много подключений, попробуйте позже", 503)
+        if len(self._subscribers[user_id]) >= self.max_per_user:
+            metrics.inc("notifications.stream.rejected")
+            raise TooManyConnections("Слишком много открытых потоков уведомлений", 429)
+
+    def subscribe(self, user_id: int) -> asyncio.Queue:
+        self.check(user_id)
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers[user_id].add(queue)
+        self._connections += 1
+        metrics.set_gauge("notifications.stream.connections", self._connections)
+        return queue
+
+    def unsubscribe(self, user_id: int, queue: asyncio.Queue) -> None:
+        queues = self._subscribers.get(user_id)
+        if not queues or queue not in queues:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self._subscribers[user_id]
+        self._connections -= 1
+        metrics.set_gauge("notifications.stream.connections", self._connections)
+
+    def publish(self, notification: dict) -> None:
+        for queue in list(self._subscribers.get(notification["user_id"], ())):
+            try:
+                queue.put_nowait(notification)
+            except asyncio.QueueFull:
+                # клиент не успевает читать — пропускаем, он догонит через GET /notifications/
+                metrics.inc("notifications.stream.dropped")
+
+    def _on_notify(self, connection, pid, channel, payload) -> None:
+        try:
+            self.publish(json.loads(payload))
+        except Exception:
+            logger.exception("Некорректное сообщение в канале %s", channel)
+
+    def listen(self, channel: str, callback) -> None:
+        """Слушать ещё один канал на том же соединении (вызывать до start)"""
+        self._channels[channel] = callback
+
+    async def start(self) -> None:
+        self._listener = asyncio.create_task(self._listen(), name="notifications-listener")
+
+    async def stop(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+            self._listener = None
+
+    async def _listen(self) -> None:
+        """LISTEN на отдельном соединении (не из пула), с переподключением"""
+        dsn = make_url(settings.database_url).set(drivername="postgresql").render_as_string(hide_password=False)
+        while True:
+            conn = None
+            try:
+                conn = await asyncpg.connect(dsn)
+                for channel, callback in self._channels.items():
+                    await conn.add_listener(channel, callback)
+                logger.info("Подписка на каналы %s", ", ".join(self._channels))
+                # периодический запрос, чтобы заметить оборванное соединение
+                while True:
+                    await asyncio.sleep(settings.notification_stream_heartbeat_seconds)
+                    await conn.execute("SELECT 1")
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                metrics.inc("notifications.listener.reconnects")
+                logger.exception("Соединение LISTEN потеряно, переподключение")
+                await asyncio.sleep(5)
+            finally:
+                if conn is not None and not conn.is_closed():
+                    await conn.close()
+
+
+notification_hub = NotificationHub(
+    max_connections=settings.notification_stream_max_connections,
+    max_per_user=settings.notification_stream_max_per_user,
+    queue_size=settings.notification_stream_queue_size,
+)
@@ -0,0 +1,317 @@
+"""
+Transactional outbox для уведомлений.
+
+Обработчики не создают уведомления сами, а добавляют компактное событие
+в outbox_events в своей же транзакции (enqueue_notification) — одна
+маленькая вставка на горячем пути платежа. Фоновый диспетчер забирает
+события пачками и раздаёт их по каналам: строки notifications, webhook, email.
+
+Доставка идёт в три шага, и ни один внешний вызов не держит блокировки:
+    1. короткая транзакция захватывает пачку (FOR UPDATE SKIP LOCKED) и
+       сдвигает available_at на outbox_lease_seconds — аренда: другие
+       диспетчеры событие не возьмут, а после падения оно вернётся само;
+    2. каналы доставляют пачку: канал в БД (transactional) — в своей
+       короткой транзакции вместе с отметкой о доставке, внешние — вне
+       какой-либо транзакции;
+    3. короткая транзакция записывает итог: доставленные события
+       удаляются, остальные откладываются.
+
+Для каждого события запоминается, какие каналы его уже получили, поэтому
+ошибка webhook не приводит к повторной записи уведомления в БД.
+Не доставленное событие откладывается с экспоненциальной задержкой,
+после outbox_max_attempts попыток — помечается failed
+"""
+import logging
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+import httpx
+from sqlalchemy import delete, func, insert, select, update
+
+from app.config import settings
+from app.database import SessionLocal
+from sqlalchemy.orm import Session
+
+from app.models import Notification, OutboxEvent, User
+from app.services.metrics import metrics
+from app.services.notification_hub import publish_notifications
+
+logger = logging.getLogger(__name__)
+
+NOTIFICATION = "notification"
+
+
+def notification_event(user_id: int, message: str, now: datetime = None) -> dict:
+    """Строка outbox_events для bulk insert (фоновые задачи, загрузка платежей)"""
+    now = now or datetime.utcnow()
+    return {
+        "topic": NOTIFICATION,
+        "user_id": user_id,
+        "payload": {"message": message},
+        "status": "pending",
+        "delivered": [],
+        "attempts": 0,
+        "available_at": now,
+        "created_at": now,
+    }
+
+
+def enqueue_notification(db, user_id: int, message: str) -> OutboxEvent:
+    """Добавить уведомление в outbox в текущей транзакции (Session или AsyncSession)"""
+    event = OutboxEvent(**notification_event(user_id, message))
+    db.add(event)
+    return event
+
+
+class Sink(ABC):
+    """
+    Канал доставки. deliver() получает пачку событий (строки outbox_events)
+    и либо доставляет все, либо бросает исключение. Транзакционный канал
+    получает сессию, внешний — db=None и вызывается вне транзакции
+    """
+    name = "base"
+    transactional = False
+
+    @abstractmethod
+    def deliver(self, db: Optional[Session], events: list) -> None:
+        ...
+
+    def close(self) -> None:
+        pass
+
+
+class NotificationSink(Sink):
+    """
+    Уведомления в таблице notifications — в той же транзакции, что и отметка
+    о доставке. После коммита они же уходят открытым потокам через pg_notify
+    """
+    name = "db"
+    transactional = True
+
+    def deliver(self, db: Session, events: list) -> None:
+        # пользователь мог быть удалён, пока событие ждало доставки
+        user_ids = {event.user_id for event in events}
+        existing = set(db.scalars(select(User.id).where(User.id.in_(user_ids))))
+        rows = [
+            {
+                "user_id": event.user_id,
+                "message": event.payload["message"],
+                "is_read": False,
+                "created_at": event.created_at,
+            }
+            for event in events if event.user_id in existing
+        ]
+        if rows:
+            created = db.execute(
+                insert(Notification).returning(
+                    Notification.id, Notification.user_id, Notification.message,
+                    Notification.is_read, Notification.created_at,
+                ),
+                rows,
+            )
+            publish_notifications(db, [dict(row._mapping) for row in created])
+
+
+class WebhookSink(Sink):
+    """POST пачки событий на внешний адрес (at-least-once: получатель должен дедуплицировать по id)"""
+    name = "webhook"
+
+    def __init__(self, url: str, timeout: float):
+        self.client = httpx.Client(base_url=url, timeout=timeout)
+
+    def deliver(self, db: Optional[Session], events: list) -> None:
+        response = self.client.post("", json=[
+            {
+                "id": event.id,
+                "topic": event.topic,
+                "user_id": event.user_id,
+                "payload": event.payload,
+                "created_at": event.created_at.isoformat(),
+            }
+            for event in events
+        ])
+        response.raise_for_status()
+
+    def close(self) -> None:
+        self.client.close()
+
+
+class EmailSink(Sink):
+    """Заглушка: письма пока только пишутся в лог"""
+    name = "email"
+
+    def deliver(self, db: Optional[Session], events: list) -> None:
+        for event in events:
+            logger.info("Письмо пользователю %s: %s", event.user_id, event.payload.get("message"))
+
+
+def build_sinks() -> List[Sink]:
+    sinks: List[Sink] = [NotificationSink()]
+    if settings.notification_webhook_url:
+        sinks.append(WebhookSink(settings.notification_webhook_url, settings.notification_webhook_timeout_seconds))
+    if settings.notification_email_enabled:
+        sinks.append(EmailSink())
+    return sinks
+
+
+def _retry_delay(attempts: int) -> timedelta:
+    return timedelta(seconds=min(settings.outbox_retry_backoff_seconds * 2 ** (attempts - 1), 3600))
+
+
+def _claim(batch_size: int) -> list:
+    """Шаг 1: захватить пачку готовых событий арендой на outbox_lease_seconds"""
+    now = datetime.utcnow()
+    ids = (
+        select(OutboxEvent.id)
+        .where(OutboxEvent.status == "pending", OutboxEvent.available_at <= now)
+        .order_by(OutboxEvent.available_at, OutboxEvent.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+        .correlate(None)  # подзапрос самостоятельный, иначе outbox_events «уйдёт» во внешний UPDATE
+    )
+    db = SessionLocal()
+    try:
+        events = db.execute(
+            update(OutboxEvent)
+            .where(OutboxEvent.id.in_(ids.scalar_subquery()))
+            .values(available_at=now + timedelta(seconds=settings.outbox_lease_seconds))
+            .returning(
+                OutboxEvent.id, OutboxEvent.topic, OutboxEvent.user_id, OutboxEvent.payload,
+                OutboxEvent.delivered, OutboxEvent.attempts, OutboxEvent.created_at,
+            )
+            .execution_options(synchronize_session=False)
+        ).all()
+        db.commit()
+    finally:
+        db.close()
+    return sorted(events, key=lambda event: event.id)
+
+
+def _deliver_in_transaction(sink: Sink, events: list) -> None:
+    """
+    Транзакционный канал: доставка и отметка в delivered — одной транзакцией,
+    поэтому после падения диспетчера событие не будет доставлено в канал дважды.
+    События, уже отмеченные другим диспетчером (истекла аренда), пропускаются
+    """
+    db = SessionLocal()
+    try:
+        pending = set(db.scalars(
+            select(OutboxEvent.id)
+            .where(OutboxEvent.id.in_([event.id for event in events]), ~OutboxEvent.delivered.has_key(sink.name))
+            .with_for_update()
+        ))
+        todo = [event for event in events if event.id in pending]
+        if todo:
+            sink.deliver(db, todo)
+            db.execute(
+                update(OutboxEvent)
+                .where(OutboxEvent.id.in_(pending))
+                .values(delivered=OutboxEvent.delivered.op("||")(func.jsonb_build_array(sink.name)))
+                .execution_options(synchronize_session=False)
+            )
+        db.commit()
+    finally:
+        db.close()
+
+
+def _record(events: list, delivered: dict, errors: dict) -> None:
+    """Шаг 3: удалить доставленные события, остальные отложить с новым available_at"""
+    now = datetime.utcnow()
+    done = [event.id for event in events if event.id not in errors]
+    retries = []
+    for event in events:
+        if event.id not in errors:
+            continue
+        attempts = event.attempts + 1
+        if attempts >= settings.outbox_max_attempts:
+            metrics.inc("outbox.dead")
+        retries.append({
+            "id": event.id,
+            "attempts": attempts,
+            "last_error": errors[event.id],
+            "available_at": now + _retry_delay(attempts),
+            "status": "failed" if attempts >= settings.outbox_max_attempts else "pending",
+            "delivered": event.delivered + delivered[event.id],
+        })
+
+    db = SessionLocal()
+    try:
+        if done:
+            # доставленные события больше не нужны
+            db.execute(delete(OutboxEvent).where(OutboxEvent.id.in_(done)))
+        if retries:
+            db.execute(update(OutboxEvent), retries)
+        db.commit()
+    finally:
+        db.close()
+
+
+def _dispatch_batch(sinks: List[Sink], batch_size: int) -> dict:
+    events = _claim(batch_size)
+    stats = {"events": len(events), "delivered": 0, "failed_sinks": 0}
+    if not events:
+        return stats
+
+    delivered = {event.id: [] for event in events}  # каналы, получившие событие в этом запуске
+    errors = {}
+    for sink in sinks:
+        todo = [event for event in events if sink.name not in event.delivered]
+        if not todo:
+            continue
+        started = time.perf_counter()
+        try:
+            if sink.transactional:
+                _deliver_in_transaction(sink, todo)
+            else:
+                sink.deliver(None, todo)
+        except Exception as e:
+            stats["failed_sinks"] += 1
+            metrics.inc(f"outbox.{sink.name}.failures")
+            logger.warning("Канал %s не принял %s событий: %r", sink.name, len(todo), e)
+            for event in todo:
+                errors[event.id] = f"{sink.name}: {e!r}"[:1000]
+            continue
+        metrics.observe(f"outbox.{sink.name}.deliver", time.perf_counter() - started)
+        metrics.inc(f"outbox.{sink.name}.delivered", len(todo))
+        for event in todo:
+            delivered[event.id].append(sink.name)
+
+    _record(events, delivered, errors)
+    stats["delivered"] = len(events) - len(errors)
+    return stats
+
+
+def dispatch_outbox(batch_size: int = None, max_batches: int = None) -> dict:
+    """
+    Разослать накопившиеся события. Не больше max_batches пачек за запуск;
+    если канал отказал — запуск прерывается, чтобы не долбить его дальше
+    """
+    batch_size = batch_size or settings.outbox_batch_size
+    max_batches = max_batches or settings.outbox_max_batches_per_run
+    sinks = build_sinks()
+    totals = {"batches": 0, "events": 0, "delivered": 0, "failed_sinks": 0}
+
+    try:
+        for _ in range(max_batches):
+            stats = _dispatch_batch(sinks, batch_size)
+
+            totals["batches"] += 1
+            for key in ("events", "delivered", "failed_sinks"):
+                totals[key] += stats[key]
+            if stats["events"] < batch_size or stats["failed_sinks"]:
+                break
+    finally:
+        for sink in sinks:
+            sink.close()
+
+    return totals
+
+
+def count_pending_events() -> int:
+    db = SessionLocal()
+    try:
+        return db.scalar(select(func.count()).select_from(OutboxEvent).where(OutboxEvent.status == "pending"))
+    finally:
+        db.close()
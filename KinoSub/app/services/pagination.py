@@ -0,0 +1,65 @@
+import base64
+import json
+from datetime import date, datetime
+from typing import Optional
+
+from fastapi import HTTPException, status
+from sqlalchemy import Date, DateTime, tuple_
+
+
+class Keyset:
+    """
+    Курсорная (keyset) пагинация по набору колонок, например (created_at, id).
+    Следующая страница — WHERE (created_at, id) < (:последние значения),
+    поэтому глубокие страницы стоят столько же, сколько первая.
+    Курсор — непрозрачная base64-строка со значениями последней строки
+    Колонки ключа должны быть NOT NULL: NULL выпадает из сравнения кортежей
+    """
+
+    def __init__(self, *columns, descending: bool = True):
+        self.columns = columns
+        self.descending = descending
+
+    def apply(self, query, cursor: Optional[str], limit: int):
+        """Добавить к запросу условие курсора, сортировку и limit (+1 строка, чтобы узнать, есть ли ещё)"""
+        if cursor:
+            values = self.decode(cursor)
+            key = tuple_(*self.columns)
+            query = query.where(key < tuple_(*values) if self.descending else key > tuple_(*values))
+
+        ordering = [column.desc() if self.descending else column.asc() for column in self.columns]
+        return query.order_by(*ordering).limit(limit + 1)
+
+    def page(self, rows, limit: int) -> dict:
+        rows = list(rows)
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = self.encode(rows[-1])
+        return {"items": rows, "next_cursor": next_cursor}
+
+    def encode(self, row) -> str:
+        values = []
+        for column in self.columns:
+            value = getattr(row, column.key)
+            values.append(value.isoformat() if isinstance(value, (date, datetime)) else value)
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def decode(self, cursor: str) -> list:
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            if len(values) != len(self.columns):
+                raise ValueError(cursor)
+            return [self._parse(column, value) for column, value in zip(self.columns, values)]
+        except (ValueError, TypeError):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Некорректный курсор")
+
+    @staticmethod
+    def _parse(column, value):
+        if isinstance(column.type, DateTime):
+            return datetime.fromisoformat(value)
+        if isinstance(column.type, Date):
+            return date.fromisoformat(value)
+        if not isinstance(value, (int, float, str)):
+            raise TypeError(value)
+        return value
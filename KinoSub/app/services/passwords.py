@@ -0,0 +1,73 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+from passlib.context import CryptContext
+
+from app.config import settings
+from app.services.metrics import metrics
+
+# min/max rounds = текущей стоимости: needs_update() вернёт True для хешей
+# с другой стоимостью, и при входе пароль будет перехеширован
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=settings.bcrypt_rounds,
+    bcrypt__min_rounds=settings.bcrypt_rounds,
+    bcrypt__max_rounds=settings.bcrypt_rounds,
+)
+
+
+class PasswordHasherBusy(Exception):
+    """Очередь на хеширование паролей переполнена"""
+
+
+# bcrypt отпускает GIL, поэтому потоки дают реальный параллелизм
+_executor = ThreadPoolExecutor(
+    max_workers=settings.password_hash_workers,
+    thread_name_prefix="password-hash",
+)
+_lock = threading.Lock()
+_pending = 0
+
+
+async def _run(operation: str, func, *args):
+    global _pending
+    with _lock:
+        if _pending >= settings.password_hash_workers + settings.password_hash_max_queue:
+            metrics.inc("passwords.rejected")
+            raise PasswordHasherBusy()
+        _pending += 1
+        metrics.set_gauge("passwords.pending", _pending)
+
+    submitted = time.perf_counter()
+
+    def task():
+        metrics.observe("passwords.queue_wait", time.perf_counter() - submitted)
+        with metrics.timer(f"passwords.{operation}"):
+            return func(*args)
+
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_executor, task)
+    finally:
+        with _lock:
+            _pending -= 1
+            metrics.set_gauge("passwords.pending", _pending)
+
+
+async def hash_password(password: str) -> str:
+    return await _run("hash", pwd_context.hash, password)
+
+
+async def verify_password(password: str, password_hash: str) -> Tuple[bool, Optional[str]]:
+    """
+    Проверка пароля. Если хеш устарел (другая стоимость bcrypt),
+    вторым элементом возвращается новый хеш, который нужно сохранить
+    """
+    return await _run("verify", pwd_context.verify_and_update, password, password_hash)
+
+
+def shutdown() -> None:
+    _executor.shutdown(wait=False)
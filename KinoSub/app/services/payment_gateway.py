@@ -0,0 +1,272 @@
+"""
+Шлюз к платёжному провайдеру.
+
+Провайдер вызывается асинхронно и вне транзакции БД (см. create_payment):
+платёж сначала сохраняется со статусом pending, после ответа провайдера
+переводится в completed или failed. Если ответа нет (таймаут, исчерпаны
+повторы), платёж остаётся pending — деньги могли уже списаться; его
+итоговый статус узнаёт сверка (lookup, см. payment_reconcile).
+
+Каждый шлюз ограничивает число одновременных запросов к провайдеру,
+повторяет временные ошибки с экспоненциальной задержкой и после серии
+ошибок размыкает цепь (circuit breaker): запросы сразу отклоняются,
+пока провайдер не восстановится
+"""
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+import random
+import time
+import uuid
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Dict, Optional
+
+import httpx
+
+from app.config import settings
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class PaymentResult:
+    status: str  # completed / failed
+    transaction_id: Optional[str] = None
+    error: Optional[str] = None
+
+
+class GatewayUnavailable(Exception):
+    """Провайдер недоступен: цепь разомкнута или исчерпаны повторы"""
+
+
+class TransientGatewayError(Exception):
+    """Временная ошибка провайдера, запрос можно повторить"""
+
+
+class CircuitBreaker:
+    """
+    closed — запросы идут; после failure_threshold ошибок подряд — open,
+    запросы отклоняются; через reset_timeout — half-open, пропускается
+    один пробный запрос: успех замыкает цепь, ошибка снова размыкает
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probe = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self._probe:
+            self._probe = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self._probe = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self._probe or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+        self._probe = False
+
+
+class PaymentGateway(ABC):
+    """Базовый шлюз: ограничение параллелизма, повторы, circuit breaker"""
+    name = "base"
+
+    def __init__(self, max_concurrency: int = None, retries: int = None, backoff: float = None):
+        self.retries = settings.payment_provider_retries if retries is None else retries
+        self.backoff = settings.payment_provider_backoff_seconds if backoff is None else backoff
+        self.max_concurrency = max_concurrency or settings.payment_provider_max_concurrency
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.breaker = CircuitBreaker(
+            failure_threshold=settings.payment_provider_circuit_failures,
+            reset_timeout=settings.payment_provider_circuit_reset_seconds,
+        )
+
+    @abstractmethod
+    async def _charge(self, reference: str, amount: Decimal, method: str) -> PaymentResult:
+        """Один запрос списания; временная ошибка — TransientGatewayError"""
+
+    @abstractmethod
+    async def _lookup(self, reference: str) -> Optional[PaymentResult]:
+        """Итог списания по нашему reference; None — провайдер такого платежа не видел"""
+
+    async def charge(self, reference: str, amount: Decimal, method: str) -> PaymentResult:
+        """
+        Списать amount. reference — наш external_id платежа, провайдер
+        использует его как ключ идемпотентности, поэтому повторы безопасны
+        """
+        for attempt in range(self.retries + 1):
+            if not self.breaker.allow():
+                metrics.inc(f"gateway.{self.name}.rejected")
+                raise GatewayUnavailable("Платёжный провайдер временно недоступен")
+            if attempt:
+                metrics.inc(f"gateway.{self.name}.retries")
+                await asyncio.sleep(self.backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+
+            try:
+                async with self._semaphore:
+                    with metrics.timer(f"gateway.{self.name}.charge"):
+                        result = await self._charge(reference, amount, method)
+            except TransientGatewayError as e:
+                self.breaker.record_failure()
+                metrics.inc(f"gateway.{self.name}.failures")
+                metrics.set_gauge(f"gateway.{self.name}.circuit_open", int(self.breaker.opened_at is not None))
+                logger.warning("Ошибка провайдера %s (попытка %s): %s", self.name, attempt + 1, e)
+                continue
+
+            self.breaker.record_success()
+            metrics.set_gauge(f"gateway.{self.name}.circuit_open", 0)
+            metrics.inc(f"gateway.{self.name}.{result.status}")
+            return result
+
+        raise GatewayUnavailable("Платёжный провайдер не ответил")
+
+    async def lookup(self, reference: str) -> Optional[PaymentResult]:
+        """Узнать у провайдера итог платежа (сверка зависших pending), без повторов"""
+        if not self.breaker.allow():
+            raise GatewayUnavailable("Платёжный провайдер временно недоступен")
+        try:
+            async with self._semaphore:
+                result = await self._lookup(reference)
+        except TransientGatewayError as e:
+            self.breaker.record_failure()
+            metrics.inc(f"gateway.{self.name}.failures")
+            raise GatewayUnavailable(str(e))
+        self.breaker.record_success()
+        return result
+
+    async def close(self) -> None:
+        pass
+
+
+class HttpPaymentGateway(PaymentGateway):
+    """Провайдер с HTTP API: один пул соединений httpx на процесс"""
+    name = "http"
+
+    def __init__(self, base_url: str = None, api_key: str = None, **kwargs):
+        super().__init__(**kwargs)
+        self.client = httpx.AsyncClient(
+            base_url=base_url or settings.payment_provider_url,
+            headers={"Authorization": f"Bearer {api_key or settings.payment_provider_api_key}"},
+            timeout=httpx.Timeout(settings.payment_provider_timeout_seconds),
+            limits=httpx.Limits(max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency),
+        )
+
+    async def _charge(self, reference: str, amount: Decimal, method: str) -> PaymentResult:
+        try:
+            response = await self.client.post(
+                "/payments",
+                json={"amount": str(amount), "currency": "RUB", "method": method, "reference": reference},
+                headers={"Idempotency-Key": reference},
+            )
+        except httpx.TransportError as e:
+            raise TransientGatewayError(repr(e))
+
+        if response.status_code == 429 or response.status_code >= 500:
+            raise TransientGatewayError(f"HTTP {response.status_code}")
+        if response.status_code >= 400:
+            # отказ провайдера (карта отклонена и т.п.) — повторять бессмысленно
+            return PaymentResult(status="failed", error=response.text[:500])
+
+        return self._result(response.json())
+
+    async def _lookup(self, reference: str) -> Optional[PaymentResult]:
+        try:
+            response = await self.client.get("/payments", params={"reference": reference})
+        except httpx.TransportError as e:
+            raise TransientGatewayError(repr(e))
+
+        if response.status_code == 404:
+            return None
+        if response.status_code == 429 or response.status_code >= 500:
+            raise TransientGatewayError(f"HTTP {response.status_code}")
+        response.raise_for_status()
+        data = response.json()
+        if data.get("status") in ("pending", "processing"):
+            # провайдер ещё не закончил — спросим при следующей сверке
+            raise TransientGatewayError("платёж ещё обрабатывается")
+        return self._result(data)
+
+    @staticmethod
+    def _result(data: dict) -> PaymentResult:
+        status = "completed" if data.get("status") in ("succeeded", "completed") else "failed"
+        return PaymentResult(status=status, transaction_id=data.get("id"), error=data.get("error"))
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+
+class FakePaymentGateway(PaymentGateway):
+    """
+    Локальный провайдер для тестов и нагрузочных прогонов: отвечает
+    с заданной задержкой, часть запросов — временная ошибка или отказ
+    """
+    name = "fake"
+
+    def __init__(self, latency: float = None, failure_rate: float = None, decline_rate: float = None, **kwargs):
+        super().__init__(**kwargs)
+        self.latency = settings.fake_provider_latency_ms / 1000 if latency is None else latency
+        self.failure_rate = settings.fake_provider_failure_rate if failure_rate is None else failure_rate
+        self.decline_rate = settings.fake_provider_decline_rate if decline_rate is None else decline_rate
+        self._results: Dict[str, PaymentResult] = {}  # reference -> итог (только в памяти процесса)
+
+    async def _charge(self, reference: str, amount: Decimal, method: str) -> PaymentResult:
+        await asyncio.sleep(self.latency)
+        if reference in self._results:
+            return self._results[reference]
+        roll = random.random()
+        if roll < self.failure_rate:
+            raise TransientGatewayError("fake: провайдер недоступен")
+        if roll < self.failure_rate + self.decline_rate:
+            result = PaymentResult(status="failed", error="fake: платёж отклонён")
+        else:
+            result = PaymentResult(status="completed", transaction_id=f"fake_{uuid.uuid4()}")
+        self._results[reference] = result
+        return result
+
+    async def _lookup(self, reference: str) -> Optional[PaymentResult]:
+        await asyncio.sleep(self.latency)
+        return self._results.get(reference)
+
+
+PROVIDERS = {
+    "fake": FakePaymentGateway,
+    "http": HttpPaymentGateway,
+}
+
+_gateway: Optional[PaymentGateway] = None
+
+
+def get_gateway() -> PaymentGateway:
+    """Шлюз, выбранный в настройках (PAYMENT_PROVIDER), создаётся при первом обращении"""
+    global _gateway
+    if _gateway is None:
+        _gateway = PROVIDERS[settings.payment_provider]()
+    return _gateway
+
+
+async def close_gateway() -> None:
+    global _gateway
+    if _gateway is not None:
+        await _gateway.close()
+        _gateway = None
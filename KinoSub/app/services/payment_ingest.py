@@ -0,0 +1,204 @@
+"""
+Загрузка файлов расчётов от процессинга (NDJSON или CSV).
+
+Файл читается построчно, строки проверяются по одной и собираются в пачки
+по payment_ingest_batch_size. Каждая пачка — одна транзакция:
+    - один SELECT проверяет, что подписки назначены пользователям;
+    - платежи вставляются одним INSERT ... ON CONFLICT (external_id) DO NOTHING,
+      поэтому повторная загрузка того же файла ничего не дублирует;
+    - подписки продлеваются одним UPDATE ... FROM (VALUES ...);
+    - события уведомлений в outbox — одним bulk INSERT.
+По каждой строке возвращается результат: created, duplicate или error,
+последним элементом — итоги загрузки
+"""
+import asyncio
+import csv
+import itertools
+import logging
+import time
+from collections import Counter
+from datetime import datetime
+from typing import AsyncIterator, Iterable, Iterator, List, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import Date, Integer, case, column, func, insert, or_, select, tuple_, update, values
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.models import OutboxEvent, Payment, Subscription, UserSubscription
+from app.schemas import BulkPaymentRecord
+from app.services.metrics import metrics
+from app.services.outbox import notification_event
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("ndjson", "csv")
+
+
+def _error_message(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(map(str, item['loc'])) or 'row'}: {item['msg']}" for item in error.errors()
+    )
+
+
+def parse_records(lines: Iterable[str], fmt: str) -> Iterator[tuple]:
+    """(номер строки, запись, ошибка) — по одной строке, файл целиком не читается"""
+    if fmt == "csv":
+        reader = csv.DictReader(lines)
+        for row in reader:
+            # пустые колонки — значения по умолчанию, лишние колонки (ключ None) игнорируем
+            row = {key: value for key, value in row.items() if key is not None and value != ""}
+            try:
+                yield reader.line_num, BulkPaymentRecord.model_validate(row), None
+            except ValidationError as e:
+                yield reader.line_num, None, _error_message(e)
+        return
+
+    for number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield number, BulkPaymentRecord.model_validate_json(line), None
+        except ValidationError as e:
+            yield number, None, _error_message(e)
+
+
+def _take(records: Iterator[tuple], size: int) -> list:
+    return list(itertools.islice(records, size))
+
+
+async def _apply_batch(db, batch: List[Tuple[int, BulkPaymentRecord]]) -> dict:
+    """Сохранить пачку валидных строк. Возвращает номер строки -> результат"""
+    now = datetime.utcnow()
+    today = now.date()
+    results = {}
+
+    pairs = {(record.user_id, record.subscription_id) for _, record in batch}
+    assigned = set((await db.execute(
+        select(UserSubscription.user_id, UserSubscription.subscription_id)
+        .where(tuple_(UserSubscription.user_id, UserSubscription.subscription_id).in_(pairs))
+    )).all())
+
+    payments, seen = [], set()
+    for number, record in batch:
+        if (record.user_id, record.subscription_id) not in assigned:
+            results[number] = {"status": "error", "error": "Подписка не назначена пользователю"}
+        elif record.external_id in seen:
+            results[number] = {"status": "duplicate"}
+        else:
+            seen.add(record.external_id)
+            payments.append({
+                "user_id": record.user_id,
+                "subscription_id": record.subscription_id,
+                "amount": record.amount,
+                "status": "completed",
+                "payment_method": record.payment_method,
+                "external_id": record.external_id,
+                "created_at": now,
+                "is_refunded": False,
+            })
+
+    inserted = {}
+    if payments:
+        # executemany одного закэшированного запроса: SQLAlchemy сам склеивает
+        # строки в INSERT ... VALUES (...), (...) RETURNING (insertmanyvalues)
+        payments_table = Payment.__table__
+        rows = await db.execute(
+            pg_insert(payments_table)
+            .on_conflict_do_nothing(index_elements=["external_id"])
+            .returning(payments_table.c.external_id, payments_table.c.id),
+            payments,
+        )
+        inserted = dict(rows.all())
+
+    periods = Counter()
+    notifications = []
+    for number, record in batch:
+        if number in results:
+            continue
+        if record.external_id not in inserted:
+            results[number] = {"status": "duplicate"}
+            continue
+        results[number] = {"status": "created", "payment_id": inserted[record.external_id]}
+        periods[(record.user_id, record.subscription_id)] += 1
+        notifications.append(
+            notification_event(record.user_id, f"Оплата {record.amount}₽ за подписку #{record.subscription_id}", now)
+        )
+
+    if periods:
+        extension = values(
+            column("user_id", Integer),
+            column("subscription_id", Integer),
+            column("periods", Integer),
+            name="extension",
+        ).data([(user_id, subscription_id, count) for (user_id, subscription_id), count in periods.items()])
+
+        # каждая оплата продлевает подписку на duration_days от конца текущего периода
+        # (или от сегодня, если подписка уже истекла)
+        await db.execute(
+            update(UserSubscription)
+            .where(
+                UserSubscription.user_id == extension.c.user_id,
+                UserSubscription.subscription_id == extension.c.subscription_id,
+                Subscription.id == UserSubscription.subscription_id,
+            )
+            .values(
+                start_date=case(
+                    (or_(UserSubscription.end_date.is_(None), UserSubscription.end_date < today), today),
+                    else_=UserSubscription.start_date,
+                ),
+                end_date=func.greatest(UserSubscription.end_date, today, type_=Date)
+                + Subscription.duration_days * extension.c.periods,
+                is_active=True,
+            )
+            .execution_options(synchronize_session=False)
+        )
+    if notifications:
+        await db.execute(insert(OutboxEvent.__table__), notifications)
+
+    return results
+
+
+async def ingest_payments(lines: Iterable[str], fmt: str, batch_size: int = None) -> AsyncIterator[dict]:
+    """
+    Загрузить платежи из итератора строк. Чтение и проверка строк
+    выполняются в отдельном потоке, чтобы не блокировать event loop
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Неизвестный формат: {fmt}")
+    batch_size = batch_size or settings.payment_ingest_batch_size
+    records = parse_records(lines, fmt)
+    stats = Counter()
+    started = time.perf_counter()
+
+    async with AsyncSessionLocal() as db:
+        while True:
+            chunk = await asyncio.to_thread(_take, records, batch_size)
+            if not chunk:
+                break
+
+            results = {number: {"status": "error", "error": error} for number, _, error in chunk if error}
+            batch = [(number, record) for number, record, _ in chunk if record is not None]
+            if batch:
+                batch_started = time.perf_counter()
+                try:
+                    results.update(await _apply_batch(db, batch))
+                    await db.commit()
+                except Exception:
+                    await db.rollback()
+                    logger.exception("Ошибка при сохранении пачки платежей (строки %s-%s)", batch[0][0], batch[-1][0])
+                    results.update({number: {"status": "error", "error": "Ошибка при сохранении пачки"} for number, _ in batch})
+                metrics.observe("payments.ingest.batch", time.perf_counter() - batch_started)
+
+            for number, record, _ in chunk:
+                result = results[number]
+                stats[result["status"]] += 1
+                if record is not None:
+                    result = {"external_id": record.external_id, **result}
+                yield {"line": number, **result}
+
+    for status, count in stats.items():
+        metrics.inc(f"payments.ingest.{status}", count)
+    yield {"summary": {**stats, "elapsed": round(time.perf_counter() - started, 3)}}
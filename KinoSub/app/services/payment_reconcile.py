@@ -0,0 +1,137 @@
+"""
+Итог платежей через провайдера и сверка зависших pending.
+
+create_payment коммитит платёж как pending и только потом идёт к
+провайдеру. Если ответа нет (таймаут, исчерпаны повторы) или процесс
+упал между коммитом и списанием, платёж остаётся pending: помечать его
+failed нельзя — провайдер мог уже списать деньги.
+
+Сверка (задача планировщика) берёт pending-платежи старше
+payment_reconcile_after_seconds и спрашивает провайдера по external_id:
+    - провайдер знает платёж — переводим в его итоговый статус;
+    - не знает — списания не было, платёж failed;
+    - провайдер недоступен — оставляем до следующего запуска
+"""
+import logging
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.models import Payment, Subscription, UserSubscription
+from app.services.metrics import metrics
+from app.services.outbox import enqueue_notification
+from app.services.payment_gateway import GatewayUnavailable, PaymentResult, get_gateway
+
+logger = logging.getLogger(__name__)
+
+
+async def activate_subscription(db: AsyncSession, subscription: UserSubscription):
+    today = datetime.utcnow().date()
+    if not subscription.end_date or subscription.end_date < today:
+        sub_info = await db.get(Subscription, subscription.subscription_id)
+        subscription.start_date = today
+        subscription.end_date = today + timedelta(days=sub_info.duration_days)
+
+    subscription.is_active = True
+
+
+async def settle_payment(db: AsyncSession, payment_id: int, result: PaymentResult) -> bool:
+    """
+    Перевести pending-платёж в итоговый статус провайдера: активировать
+    подписку и добавить уведомление. Коммит — за вызывающим.
+    False — платёж уже не pending (его завершил другой запрос или сверка)
+    """
+    values = {"status": result.status}
+    if result.transaction_id:
+        # external_id не трогаем: по нему сверка спрашивает провайдера
+        values["provider_transaction_id"] = result.transaction_id
+    settled = await db.execute(
+        update(Payment)
+        .where(Payment.id == payment_id, Payment.status == "pending")
+        .values(**values)
+        .returning(Payment.user_id, Payment.subscription_id, Payment.amount)
+    )
+    payment = settled.first()
+    if payment is None:
+        return False
+
+    if result.status == "completed":
+        subscription = await db.scalar(
+            select(UserSubscription).where(
+                UserSubscription.user_id == payment.user_id,
+                UserSubscription.subscription_id == payment.subscription_id,
+            )
+        )
+        if subscription:
+            await activate_subscription(db, subscription)
+        enqueue_notification(
+            db, payment.user_id, f"Оплата {payment.amount}₽ за подписку #{payment.subscription_id}"
+        )
+    else:
+        enqueue_notification(
+            db, payment.user_id, f"Платёж {payment.amount}₽ за подписку #{payment.subscription_id} отклонён"
+        )
+    return True
+
+
+def _stale_pending_query(cutoff: datetime, after_id: int, limit: int):
+    return (
+        select(Payment.id, Payment.external_id)
+        .where(Payment.status == "pending", Payment.created_at < cutoff, Payment.id > after_id)
+        .order_by(Payment.id)
+        .limit(limit)
+    )
+
+
+async def _reconcile_one(payment_id: int, reference: str) -> str:
+    """Сверить один платёж: completed / failed / pending (провайдер недоступен или уже сверено)"""
+    try:
+        result = await get_gateway().lookup(reference)
+    except GatewayUnavailable as e:
+        logger.warning("Сверка платежа #%s отложена: %s", payment_id, e)
+        return "pending"
+    if result is None:
+        # провайдер о платеже не знает — списания не было
+        result = PaymentResult(status="failed", error="платёж не дошёл до провайдера")
+
+    async with AsyncSessionLocal() as db:
+        settled = await settle_payment(db, payment_id, result)
+        await db.commit()
+    return result.status if settled else "pending"
+
+
+async def reconcile_payments(batch_size: int = None) -> dict:
+    """Сверить с провайдером pending-платежи старше payment_reconcile_after_seconds (задача планировщика)"""
+    batch_size = batch_size or settings.payment_reconcile_batch_size
+    cutoff = datetime.utcnow() - timedelta(seconds=settings.payment_reconcile_after_seconds)
+    stats = {"completed": 0, "failed": 0, "pending": 0}
+    last_id = 0
+
+    while True:
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(_stale_pending_query(cutoff, last_id, batch_size))).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+
+        for row in rows:
+            stats[await _reconcile_one(row.id, row.external_id)] += 1
+
+        if len(rows) < batch_size:
+            break
+
+    metrics.inc("payments.reconciled.completed", stats["completed"])
+    metrics.inc("payments.reconciled.failed", stats["failed"])
+    metrics.set_gauge("payments.reconcile.still_pending", stats["pending"])
+    return stats
+
+
+async def count_stale_payments() -> int:
+    cutoff = datetime.utcnow() - timedelta(seconds=settings.payment_reconcile_after_seconds)
+    async with AsyncSessionLocal() as db:
+        return await db.scalar(
+            select(func.count()).select_from(Payment).where(Payment.status == "pending", Payment.created_at < cutoff)
+        )
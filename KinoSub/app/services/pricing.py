@@ -0,0 +1,87 @@
+"""
+Цены подписок с учётом скидок.
+
+Цена на дату — price * (1 - discount_rate), пока дата не позже
+discount_until (без discount_until скидка бессрочная), иначе полная цена.
+Округление — до копеек, половина вверх.
+
+PriceTable строится один раз на снимок каталога (см. catalog_cache) и
+хранит готовые цены по дням на pricing_table_days вперёд, поэтому
+оплата, автопродление и каталог берут цену из одной таблицы и не
+пересчитывают её для каждой строки
+"""
+from dataclasses import dataclass
+from datetime import date, timedelta
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Dict, Iterable, List, Optional
+
+CENT = Decimal("0.01")
+
+
+def _money(value) -> Decimal:
+    return Decimal(str(value)).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def discount_active(subscription, on: date) -> bool:
+    return bool(subscription.discount_rate) and (
+        subscription.discount_until is None or on <= subscription.discount_until
+    )
+
+
+def effective_price(subscription, on: date) -> Decimal:
+    """Цена подписки (модель или любой объект с price/discount_rate/discount_until) на дату"""
+    price = Decimal(str(subscription.price))
+    if discount_active(subscription, on):
+        # API не пропускает скидку вне [0, 1), но в старых строках она может быть любой
+        rate = min(max(Decimal(str(subscription.discount_rate)), Decimal(0)), Decimal(1))
+        price *= 1 - rate
+    return _money(price)
+
+
+@dataclass(frozen=True)
+class PriceRule:
+    """Ценовые поля подписки, отвязанные от сессии БД"""
+    price: Decimal
+    discount_rate: Optional[Decimal]
+    discount_until: Optional[date]
+
+
+class PriceTable:
+    """Цены всех подписок каталога по дням начиная со start"""
+
+    def __init__(self, subscriptions: Iterable, start: date, days: int):
+        self.start = start
+        self.days = days
+        self._rules: Dict[int, PriceRule] = {}
+        self._table: Dict[int, List[Decimal]] = {}
+        for subscription in subscriptions:
+            rule = PriceRule(subscription.price, subscription.discount_rate, subscription.discount_until)
+            self._rules[subscription.id] = rule
+            self._table[subscription.id] = self._row(rule)
+
+    def _row(self, rule: PriceRule) -> List[Decimal]:
+        # цена меняется не чаще одного раза — на следующий день после discount_until
+        first = effective_price(rule, self.start)
+        if not discount_active(rule, self.start) or rule.discount_until is None:
+            return [first] * self.days
+        discounted_days = min((rule.discount_until - self.start).days + 1, self.days)
+        full = effective_price(rule, rule.discount_until + timedelta(days=1))
+        return [first] * discounted_days + [full] * (self.days - discounted_days)
+
+    def price(self, subscription_id: int, on: date) -> Optional[Decimal]:
+        """Цена на дату; None — подписки нет в каталоге"""
+        rule = self._rules.get(subscription_id)
+        if rule is None:
+            return None
+        offset = (on - self.start).days
+        if 0 <= offset < self.days:
+            return self._table[subscription_id][offset]
+        return effective_price(rule, on)
+
+    def prices(self, subscription_ids: Iterable[int], on: date) -> Dict[int, Decimal]:
+        """Цены для набора подписок на одну дату (пачка автопродления)"""
+        return {
+            subscription_id: price
+            for subscription_id in set(subscription_ids)
+            if (price := self.price(subscription_id, on)) is not None
+        }
@@ -0,0 +1,113 @@
+"""
+Счётчик SQL-запросов на HTTP-запрос — ловит N+1 при разработке и в тестах.
+
+Каждый запрос к БД (синхронный и async движки) учитывается в журнале
+текущего HTTP-запроса (contextvar, переживает переход в threadpool).
+После ответа число запросов сравнивается с бюджетом маршрута:
+    warn  — предупреждение в лог с самым частым запросом;
+    raise — исключение QueryBudgetExceeded (TestClient пробросит его в тест);
+    off   — счётчик не подключается вовсе (по умолчанию, для продакшена)
+"""
+import logging
+from collections import Counter
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from sqlalchemy import event
+
+from app.config import settings
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Бюджеты для списков (с запасом на загрузку пользователя при промахе кэша
+# авторизации). None — маршрут не проверяется
+ROUTE_BUDGETS: Dict[str, Optional[int]] = {
+    "GET /user-subscriptions/me": 3,
+    "GET /subscription-requests/admin": 3,
+    "GET /notifications/": 3,
+    "GET /payments/": 3,
+    "GET /users/": 3,
+    "GET /wallet/history": 3,
+    "POST /payments/bulk": None,
+    "POST /subscription-requests/admin/bulk": None,
+}
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class QueryLog:
+    def __init__(self):
+        self.count = 0
+        self.statements = Counter()
+
+    def record(self, statement: str) -> None:
+        self.count += 1
+        self.statements[statement] += 1
+
+
+_current: ContextVar[Optional[QueryLog]] = ContextVar("query_log", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    log = _current.get()
+    if log is not None:
+        log.record(statement)
+
+
+class QueryBudgetMiddleware:
+    """ASGI middleware (а не BaseHTTPMiddleware), чтобы не мешать потоковым ответам"""
+
+    def __init__(self, app, mode: str, default_budget: int, budgets: Dict[str, Optional[int]]):
+        self.app = app
+        self.mode = mode
+        self.default_budget = default_budget
+        self.budgets = budgets
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        log = QueryLog()
+        token = _current.set(log)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _current.reset(token)
+        self._check(scope, log)
+
+    def _check(self, scope, log: QueryLog) -> None:
+        route = scope.get("route")
+        if route is None:
+            return
+        key = f"{scope['method']} {route.path_format}"
+        budget = self.budgets.get(key, self.default_budget)
+        if budget is None or log.count <= budget:
+            return
+
+        metrics.inc("db.query_budget.exceeded")
+        statement, repeats = log.statements.most_common(1)[0]
+        message = (
+            f"{key}: {log.count} SQL-запросов при бюджете {budget}; "
+            f"чаще всего ({repeats} раз): {' '.join(statement.split())[:300]}"
+        )
+        if self.mode == "raise":
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
+
+
+def install_query_budget(app, engines) -> None:
+    """Подключить счётчик, если он включён в настройках (QUERY_BUDGET_MODE)"""
+    if settings.query_budget_mode == "off":
+        return
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    app.add_middleware(
+        QueryBudgetMiddleware,
+        mode=settings.query_budget_mode,
+        default_budget=settings.query_budget_default,
+        budgets={**ROUTE_BUDGETS, **settings.query_budgets},
+    )
@@ -0,0 +1,159 @@
+import asyncio
+import logging
+import time
+import math
+import zlib
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Callable, List, Optional
+
+from sqlalchemy import func, select, text
+from sqlalchemy.dialects.postgresql import insert
+
+from app.database import async_engine
+from app.models import SchedulerJob
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Job:
+    name: str
+    func: Callable[[], object]  # синхронная — в отдельном потоке, корутина — в цикле событий
+    interval: float  # секунды
+    backlog: Optional[Callable[[], int]] = None  # сколько работы накопилось
+
+    @property
+    def lock_key(self) -> int:
+        return zlib.crc32(f"scheduler:{self.name}".encode())
+
+
+def seconds_until_next_run(interval: float, now: float = None) -> float:
+    """
+    Запуски выровнены по границам интервала (как в cron: каждый час — в :00),
+    поэтому все воркеры просыпаются одновременно и задачу забирает один из них
+    """
+    now = time.time() if now is None else now
+    return interval - (now % interval)
+
+
+def current_slot(interval: float, now: float) -> float:
+    """
+    Граница интервала, к которой относится момент now.
+    Небольшой допуск — на случай, если таймер или часы узла чуть спешат
+    относительно часов Postgres
+    """
+    return math.floor((now + min(1.0, interval / 10)) / interval) * interval
+
+
+async def _call(func: Callable[[], object]):
+    if asyncio.iscoroutinefunction(func):
+        return await func()
+    return await asyncio.to_thread(func)
+
+
+def _epoch(value: datetime) -> float:
+    return value.replace(tzinfo=timezone.utc).timestamp()
+
+
+class Scheduler:
+    """
+    Планировщик фоновых задач внутри процесса.
+    Задача выполняется только под Postgres advisory lock: если её уже
+    выполняет другой воркер uvicorn, этот запуск пропускается.
+    Под тем же локом проверяется scheduler_jobs.next_run_at: задача,
+    уже выполненная в текущем интервале другим воркером (или до рестарта),
+    не запускается повторно. При старте процесса задача выполняется, только
+    если пропущен интервал (простой). Все задачи должны быть идемпотентными
+    """
+
+    def __init__(self):
+        self.jobs: List[Job] = []
+        self._tasks: List[asyncio.Task] = []
+
+    def register(self, name: str, func: Callable[[], object], interval: float,
+                 backlog: Callable[[], int] = None) -> Job:
+        job = Job(name=name, func=func, interval=interval, backlog=backlog)
+        self.jobs.append(job)
+        return job
+
+    async def start(self) -> None:
+        for job in self.jobs:
+            self._tasks.append(asyncio.create_task(self._loop(job), name=f"job:{job.name}"))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    async def _loop(self, job: Job) -> None:
+        # догнать пропущенное после простоя (если задача не выполнялась в текущем интервале)
+        await self.run_job(job)
+        while True:
+            await asyncio.sleep(seconds_until_next_run(job.interval))
+            await self.run_job(job)
+
+    async def run_job(self, job: Job) -> bool:
+        """
+        Выполнить задачу, если её не выполняет кто-то ещё и она ещё не
+        выполнялась в текущем интервале. True — задача выполнена
+        """
+        try:
+            async with async_engine.connect() as conn:
+                # без открытой транзакции: задача может идти долго, а лок — сессионный
+                conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+                locked = await conn.scalar(select(func.pg_try_advisory_lock(job.lock_key)))
+                if not locked:
+                    metrics.inc(f"scheduler.{job.name}.skipped")
+                    return False
+                try:
+                    slot = await self._due_slot(conn, job)
+                    if slot is None:
+                        metrics.inc(f"scheduler.{job.name}.not_due")
+                        return False
+                    await self._execute(job)
+                    await self._mark_done(conn, job, slot)
+                finally:
+                    await conn.scalar(select(func.pg_advisory_unlock(job.lock_key)))
+            return True
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            metrics.inc(f"scheduler.{job.name}.failures")
+            logger.exception("Фоновая задача %s завершилась с ошибкой", job.name)
+            return False
+
+    async def _due_slot(self, conn, job: Job) -> Optional[float]:
+        """Текущий интервал задачи (по часам Postgres) или None, если в нём задача уже выполнена"""
+        now = float(await conn.scalar(text("SELECT extract(epoch FROM clock_timestamp())")))
+        slot = current_slot(job.interval, now)
+        next_run_at = await conn.scalar(select(SchedulerJob.next_run_at).where(SchedulerJob.name == job.name))
+        if next_run_at is not None and slot < _epoch(next_run_at):
+            return None
+        return slot
+
+    async def _mark_done(self, conn, job: Job, slot: float) -> None:
+        values = {
+            "last_run_at": func.timezone("utc", func.clock_timestamp()),
+            "next_run_at": datetime.utcfromtimestamp(slot + job.interval),
+        }
+        statement = insert(SchedulerJob).values(name=job.name, **values)
+        await conn.execute(statement.on_conflict_do_update(index_elements=[SchedulerJob.name], set_=values))
+
+    async def _execute(self, job: Job) -> None:
+        if job.backlog is not None:
+            metrics.set_gauge(f"scheduler.{job.name}.backlog", await _call(job.backlog))
+
+        started = time.perf_counter()
+        result = await _call(job.func)
+        elapsed = time.perf_counter() - started
+
+        metrics.inc(f"scheduler.{job.name}.runs")
+        metrics.observe(f"scheduler.{job.name}.duration", elapsed)
+        metrics.set_gauge(f"scheduler.{job.name}.last_success", time.time())
+        logger.info("Фоновая задача %s выполнена за %.2f с: %s", job.name, elapsed, result)
+
+
+scheduler = Scheduler()
@@ -153,7 +153,13 @@ document.addEventListener("DOMContentLoaded", () => {
 
         const result = await res.json();
 
-        if (res.ok) {
+        if (res.ok && result.status === "pending") {
+            // провайдер не ответил — итог придёт уведомлением после сверки
+            alert("Платёж обрабатывается, результат придёт в уведомлениях");
+            document.getElementById("pay-subscription-form").reset();
+        } else if (res.ok && result.status === "failed") {
+            alert("Платёж отклонён");
+        } else if (res.ok) {
             alert("Подписка успешно оплачена!");
             document.getElementById("pay-subscription-form").reset();
             loadWallet();  // обновим баланс
@@ -223,7 +229,7 @@ function showUIAfterLogin(user) {
 
 async function loadSubscriptions(user) {
     const res = await fetch("/subscriptions/?active_only=true");
-    const subs = await res.json();
+    const subs = (await res.json()).items;
     const list = document.getElementById("subscription-list");
     list.innerHTML = "";
 
@@ -234,7 +240,9 @@ async function loadSubscriptions(user) {
 
     for (const sub of subs) {
         const li = document.createElement("li");
-        li.innerHTML = `<strong>${sub.name}</strong> — ${sub.price}₽ на ${sub.duration_days} дней`;
+        const price = sub.effective_price ?? sub.price;
+        const oldPrice = price < sub.price ? ` <s>${sub.price}₽</s>` : "";
+        li.innerHTML = `<strong>${sub.name}</strong> — ${price}₽${oldPrice} на ${sub.duration_days} дней`;
 
         if (user?.role === "admin") {
             const editBtn = document.createElement("button");
@@ -264,7 +272,7 @@ async function loadSubscriptions(user) {
                 payBtn.textContent = "Оплатить";
                 payBtn.onclick = () => {
                     document.getElementById("pay-subscription-id").value = sub.id;
-                    document.getElementById("pay-amount").value = sub.price;
+                    document.getElementById("pay-amount").value = price;
                     document.getElementById("pay-subscription-form").scrollIntoView({ behavior: "smooth" });
                 };
                 li.appendChild(payBtn);
@@ -344,7 +352,7 @@ async function loadWallet() {
     const historyRes = await fetch("/wallet/history", {
         headers: { Authorization: "Bearer " + token }
     });
-    const history = await historyRes.json();
+    const history = (await historyRes.json()).items;
     const list = document.getElementById("wallet-history-list");
     list.innerHTML = "";
 
@@ -360,7 +368,7 @@ async function loadPaymentHistory() {
     const res = await fetch("/payments/", {
         headers: { Authorization: "Bearer " + token }
     });
-    const payments = await res.json();
+    const payments = (await res.json()).items;
 
     const list = document.getElementById("payment-history-list");
     list.innerHTML = "";
@@ -389,44 +397,46 @@ async function requestAccess(subId) {
     }
 }
 
-async function loadSubscriptionRequests() {
-    const res = await fetch("/subscription-requests/admin", {
-        headers: {
-            Authorization: "Bearer " + localStorage.getItem("token")
-        }
-    });
+async function loadSubscriptionRequests(cursor = null) {
+    const headers = { Authorization: "Bearer " + localStorage.getItem("token") };
+    const params = new URLSearchParams({ status: "pending", limit: 50 });
+    if (cursor) params.set("cursor", cursor);
+
+    const res = await fetch(`/subscription-requests/admin?${params}`, { headers });
 
     if (!res.ok) {
         console.error("Ошибка при получении запросов на подписки");
         return;
     }
 
-    const requests = await res.json();
+    const page = await res.json();
     const list = document.getElementById("request-list");
-    list.innerHTML = "";
+    const moreBtn = document.getElementById("request-more");
+    if (!cursor) list.innerHTML = "";
 
-    if (requests.length === 0) {
-        list.innerHTML = "<li>Нет запросов</li>";
-        return;
+    const countRes = await fetch("/subscription-requests/admin/pending-count", { headers });
+    if (countRes.ok) {
+        const { pending } = await countRes.json();
+        document.getElementById("request-count").textContent = pending ? `(${pending})` : "";
     }
 
-    const pendingRequests = requests.filter(req => req.status === "pending");
-
-    if (pendingRequests.length === 0) {
+    if (!cursor && page.items.length === 0) {
         list.innerHTML = "<li>Нет новых запросов</li>";
-        return;
     }
 
-    pendingRequests.forEach(req => {
+    page.items.forEach(req => {
         const li = document.createElement("li");
         li.innerHTML = `
-            <strong>Пользователь #${req.user_id}</strong> запросил подписку #${req.subscription_id} 
+            <strong>${req.user?.username ?? "Пользователь #" + req.user_id}</strong> запросил подписку ${req.subscription?.name ?? "#" + req.subscription_id}
             <button onclick="approveRequest(${req.id})">Одобрить</button>
             <button onclick="rejectRequest(${req.id})">Отклонить</button>
         `;
         list.appendChild(li);
     });
 
+    // следующая страница очереди — по курсору
+    moreBtn.style.display = page.next_cursor ? "inline" : "none";
+    moreBtn.onclick = () => loadSubscriptionRequests(page.next_cursor);
 }
 
 
@@ -448,6 +458,28 @@ async function approveRequest(id) {
     }
 }
 
+// Все ожидающие заявки, пришедшие до нажатия кнопки, — одним запросом
+async function bulkReviewRequests(action) {
+    if (!confirm(action === "approve" ? "Одобрить все ожидающие заявки?" : "Отклонить все ожидающие заявки?")) return;
+
+    const res = await fetch("/subscription-requests/admin/bulk", {
+        method: "POST",
+        headers: {
+            "Content-Type": "application/json",
+            Authorization: "Bearer " + localStorage.getItem("token")
+        },
+        body: JSON.stringify({ action, filter: { created_before: new Date().toISOString() } })
+    });
+
+    const data = await res.json();
+    if (res.ok) {
+        alert(`Обработано заявок: ${data.processed}`);
+        loadSubscriptionRequests();
+    } else {
+        alert("Ошибка: " + data.detail);
+    }
+}
+
 async function rejectRequest(id) {
     const res = await fetch(`/subscription-requests/admin/${id}/reject`, {
         method: "PATCH",  // ← и здесь тоже
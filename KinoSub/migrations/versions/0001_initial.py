@@ -0,0 +1,103 @@
+"""Исходная схема (как до появления миграций)
+
+Revision ID: 0001_initial
+Revises:
+Create Date: 2026-10-18
+
+Для существующей базы не применять, а отметить: alembic stamp 0001_initial
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "0001_initial"
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "users",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("username", sa.String(50), nullable=False, unique=True),
+        sa.Column("email", sa.String(100), nullable=False, unique=True),
+        sa.Column("password_hash", sa.String(255), nullable=False),
+        sa.Column("role", sa.String(10), nullable=False),
+        sa.Column("balance", sa.Numeric(10, 2)),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+    )
+    op.create_table(
+        "subscriptions",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("name", sa.String(100), nullable=False),
+        sa.Column("price", sa.Numeric(10, 2), nullable=False),
+        sa.Column("duration_days", sa.Integer(), nullable=False),
+        sa.Column("description", sa.Text()),
+        sa.Column("is_active", sa.Boolean(), nullable=False),
+        sa.Column("discount_rate", sa.Numeric(3, 2)),
+        sa.Column("discount_until", sa.Date()),
+    )
+    op.create_table(
+        "user_subscriptions",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("subscription_id", sa.Integer(), sa.ForeignKey("subscriptions.id"), nullable=False),
+        sa.Column("start_date", sa.Date()),
+        sa.Column("end_date", sa.Date()),
+        sa.Column("is_active", sa.Boolean()),
+        sa.Column("auto_renew", sa.Boolean()),
+    )
+    op.create_table(
+        "payments",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id")),
+        sa.Column("subscription_id", sa.Integer(), sa.ForeignKey("subscriptions.id")),
+        sa.Column("amount", sa.Numeric(10, 2)),
+        sa.Column("status", sa.String(20)),
+        sa.Column("payment_method", sa.String(20)),
+        sa.Column("external_id", sa.String(100)),
+        sa.Column("created_at", sa.DateTime()),
+        sa.Column("is_refunded", sa.Boolean()),
+        sa.Column("refund_reason", sa.Text()),
+    )
+    op.create_index("ix_payments_id", "payments", ["id"])
+    op.create_table(
+        "notifications",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id")),
+        sa.Column("message", sa.String(), nullable=False),
+        sa.Column("is_read", sa.Boolean()),
+        sa.Column("created_at", sa.DateTime()),
+    )
+    op.create_index("ix_notifications_id", "notifications", ["id"])
+    op.create_table(
+        "balance_transactions",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("amount", sa.Numeric(10, 2), nullable=False),
+        sa.Column("type", sa.Enum("topup", "withdraw", name="transactiontype"), nullable=False),
+        sa.Column("description", sa.Text()),
+        sa.Column("created_at", sa.DateTime()),
+    )
+    op.create_table(
+        "subscription_requests",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id")),
+        sa.Column("subscription_id", sa.Integer(), sa.ForeignKey("subscriptions.id")),
+        sa.Column("status", sa.String()),
+        sa.Column("created_at", sa.DateTime()),
+    )
+    op.create_index("ix_subscription_requests_id", "subscription_requests", ["id"])
+
+
+def downgrade() -> None:
+    op.drop_table("subscription_requests")
+    op.drop_table("balance_transactions")
+    sa.Enum(name="transactiontype").drop(op.get_bind(), checkfirst=True)
+    op.drop_table("notifications")
+    op.drop_table("payments")
+    op.drop_table("user_subscriptions")
+    op.drop_table("subscriptions")
+    op.drop_table("users")
@@ -0,0 +1,57 @@
+"""Индексы под горячие запросы роутеров и фоновых задач
+
+Revision ID: 0002_hot_path_indexes
+Revises: 0001_initial
+Create Date: 2026-10-18
+
+Индексы создаются CONCURRENTLY, без блокировки записи в таблицы.
+Уникальные ограничения не создадутся, если в данных уже есть дубликаты —
+их нужно предварительно устранить вручную.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "0002_hot_path_indexes"
+down_revision: Union[str, None] = "0001_initial"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (имя, таблица, колонки, параметры)
+INDEXES = [
+    ("uq_user_subscriptions_user_subscription", "user_subscriptions", ["user_id", "subscription_id"],
+     {"unique": True}),
+    ("ix_user_subscriptions_renewal_due", "user_subscriptions", ["end_date", "id"],
+     {"postgresql_where": sa.text("auto_renew AND is_active")}),
+    ("ix_user_subscriptions_active_end_date", "user_subscriptions", ["end_date"],
+     {"postgresql_where": sa.text("is_active")}),
+    ("ix_payments_user_created", "payments", ["user_id", "created_at", "id"], {}),
+    ("ix_notifications_user_created", "notifications", ["user_id", "created_at", "id"], {}),
+    ("ix_notifications_read_created", "notifications", ["created_at"],
+     {"postgresql_where": sa.text("is_read")}),
+    ("ix_balance_transactions_user_created", "balance_transactions", ["user_id", "created_at", "id"], {}),
+    ("ix_subscription_requests_user_subscription_status", "subscription_requests",
+     ["user_id", "subscription_id", "status"], {}),
+    ("uq_subscription_requests_pending", "subscription_requests", ["user_id", "subscription_id"],
+     {"unique": True, "postgresql_where": sa.text("status = 'pending'")}),
+]
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, columns, options in INDEXES:
+            op.create_index(name, table, columns, postgresql_concurrently=True, if_not_exists=True, **options)
+
+    # уникальный индекс превращаем в ограничение, как объявлено в модели
+    op.execute(
+        "ALTER TABLE user_subscriptions ADD CONSTRAINT uq_user_subscriptions_user_subscription "
+        "UNIQUE USING INDEX uq_user_subscriptions_user_subscription"
+    )
+
+
+def downgrade() -> None:
+    op.drop_constraint("uq_user_subscriptions_user_subscription", "user_subscriptions", type_="unique")
+    with op.get_context().autocommit_block():
+        for name, table, _, _ in reversed(INDEXES[1:]):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,31 @@
+"""Уникальный external_id платежа
+
+Revision ID: 0004_payments_external_id_unique
+Revises: 0003_idempotency_keys
+Create Date: 2026-10-18
+
+Нужен для загрузки файлов расчётов (INSERT ... ON CONFLICT (external_id)).
+Индекс создаётся CONCURRENTLY; если в payments уже есть дубли external_id,
+их нужно предварительно устранить вручную.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = "0004_payments_external_id_unique"
+down_revision: Union[str, None] = "0003_idempotency_keys"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "uq_payments_external_id", "payments", ["external_id"],
+            unique=True, postgresql_concurrently=True, if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index("uq_payments_external_id", table_name="payments", postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,35 @@
+"""Частичный индекс непрочитанных уведомлений
+
+Revision ID: 0006_notifications_unread_index
+Revises: 0005_outbox_events
+Create Date: 2026-10-18
+
+GET /notifications/unread-count и POST /notifications/read читают только
+непрочитанные строки пользователя. Индекс создаётся CONCURRENTLY.
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "0006_notifications_unread_index"
+down_revision: Union[str, None] = "0005_outbox_events"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_notifications_user_unread", "notifications", ["user_id", "created_at"],
+            postgresql_where=sa.text("is_read = false"),
+            postgresql_concurrently=True, if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_notifications_user_unread", table_name="notifications",
+            postgresql_concurrently=True, if_exists=True,
+        )
@@ -0,0 +1,39 @@
+"""Архив уведомлений
+
+Revision ID: 0007_notifications_archive
+Revises: 0006_notifications_unread_index
+Create Date: 2026-10-18
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "0007_notifications_archive"
+down_revision: Union[str, None] = "0006_notifications_unread_index"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "notifications_archive",
+        sa.Column("id", sa.Integer(), primary_key=True, autoincrement=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("message", sa.String(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column(
+            "archived_at", sa.DateTime(),
+            server_default=sa.text("(now() at time zone 'utc')"), nullable=False,
+        ),
+    )
+    op.create_index(
+        "ix_notifications_archive_user_created", "notifications_archive", ["user_id", "created_at"]
+    )
+    op.create_index("ix_notifications_archive_archived", "notifications_archive", ["archived_at"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_notifications_archive_archived", table_name="notifications_archive")
+    op.drop_index("ix_notifications_archive_user_created", table_name="notifications_archive")
+    op.drop_table("notifications_archive")
@@ -0,0 +1,26 @@
+"""Версия каталога подписок
+
+Revision ID: 0008_catalog_version_seq
+Revises: 0007_notifications_archive
+Create Date: 2026-10-18
+
+Номер версии для кэша каталога: каждое изменение подписок берёт nextval
+и рассылает его воркерам через pg_notify.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "0008_catalog_version_seq"
+down_revision: Union[str, None] = "0007_notifications_archive"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute(sa.schema.CreateSequence(sa.Sequence("catalog_version_seq")))
+
+
+def downgrade() -> None:
+    op.execute(sa.schema.DropSequence(sa.Sequence("catalog_version_seq")))
@@ -0,0 +1,43 @@
+"""Индексы очереди заявок на подписку
+
+Revision ID: 0009_subscription_requests_queue
+Revises: 0008_catalog_version_seq
+Create Date: 2026-10-18
+
+Частичный индекс ожидающих заявок для очереди админа и индекс
+(status, created_at, id) для истории. Создаются CONCURRENTLY.
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "0009_subscription_requests_queue"
+down_revision: Union[str, None] = "0008_catalog_version_seq"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_subscription_requests_pending_queue", "subscription_requests", ["created_at", "id"],
+            postgresql_where=sa.text("status = 'pending'"),
+            postgresql_concurrently=True, if_not_exists=True,
+        )
+        op.create_index(
+            "ix_subscription_requests_status_created", "subscription_requests", ["status", "created_at", "id"],
+            postgresql_concurrently=True, if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_subscription_requests_status_created", table_name="subscription_requests",
+            postgresql_concurrently=True, if_exists=True,
+        )
+        op.drop_index(
+            "ix_subscription_requests_pending_queue", table_name="subscription_requests",
+            postgresql_concurrently=True, if_exists=True,
+        )
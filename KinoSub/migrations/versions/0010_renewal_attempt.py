@@ -0,0 +1,26 @@
+"""День последней попытки автопродления
+
+Revision ID: 0010_renewal_attempt
+Revises: 0009_subscription_requests_queue
+Create Date: 2026-10-18
+
+user_subscriptions.last_renewal_attempt: подписка, по которой сегодня уже
+была попытка автопродления, не выбирается повторно в тот же день.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "0010_renewal_attempt"
+down_revision: Union[str, None] = "0009_subscription_requests_queue"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("user_subscriptions", sa.Column("last_renewal_attempt", sa.Date(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("user_subscriptions", "last_renewal_attempt")
@@ -0,0 +1,32 @@
+"""Состояние задач планировщика
+
+Revision ID: 0011_scheduler_jobs
+Revises: 0010_renewal_attempt
+Create Date: 2026-10-18
+
+scheduler_jobs: граница следующего интервала для каждой фоновой задачи.
+Задача, уже выполненная в текущем интервале, не запускается повторно
+другим воркером или после рестарта.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "0011_scheduler_jobs"
+down_revision: Union[str, None] = "0010_renewal_attempt"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "scheduler_jobs",
+        sa.Column("name", sa.String(length=100), primary_key=True),
+        sa.Column("last_run_at", sa.DateTime(), nullable=True),
+        sa.Column("next_run_at", sa.DateTime(), nullable=True),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("scheduler_jobs")
@@ -0,0 +1,47 @@
+"""created_at NOT NULL в таблицах со списками
+
+Revision ID: 0012_created_at_not_null
+Revises: 0011_scheduler_jobs
+Create Date: 2026-10-18
+
+Курсорная пагинация идёт по (created_at, id): строка с NULL в created_at
+выпадает из сравнения кортежей и даёт курсор, который нельзя разобрать.
+Старые строки без даты получают самую раннюю дату таблицы. NOT NULL
+ставится через проверенный CHECK, чтобы не сканировать таблицу под
+эксклюзивной блокировкой: шаги идут в autocommit_block, каждый в своей
+транзакции, и VALIDATE держит только SHARE UPDATE EXCLUSIVE.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = "0012_created_at_not_null"
+down_revision: Union[str, None] = "0011_scheduler_jobs"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TABLES = ("notifications", "subscription_requests", "payments", "balance_transactions")
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        for table in TABLES:
+            op.execute(
+                f"UPDATE {table} SET created_at = coalesce("
+                f"(SELECT min(created_at) FROM {table}), now() at time zone 'utc'"
+                f") WHERE created_at IS NULL"
+            )
+            # остаток от прерванного прогона
+            op.execute(f"ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {table}_created_at_not_null")
+            op.execute(
+                f"ALTER TABLE {table} ADD CONSTRAINT {table}_created_at_not_null "
+                f"CHECK (created_at IS NOT NULL) NOT VALID"
+            )
+            op.execute(f"ALTER TABLE {table} VALIDATE CONSTRAINT {table}_created_at_not_null")
+            op.alter_column(table, "created_at", nullable=False)
+            op.execute(f"ALTER TABLE {table} DROP CONSTRAINT {table}_created_at_not_null")
+
+
+def downgrade() -> None:
+    for table in TABLES:
+        op.alter_column(table, "created_at", nullable=True)
@@ -0,0 +1,32 @@
+"""Индекс pending-платежей для сверки с провайдером
+
+Revision ID: 0013_payments_pending_index
+Revises: 0012_created_at_not_null
+Create Date: 2026-10-18
+
+Частичный индекс по created_at для status = 'pending': сверка находит
+зависшие платежи, не читая всю таблицу. Создаётся CONCURRENTLY.
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "0013_payments_pending_index"
+down_revision: Union[str, None] = "0012_created_at_not_null"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_payments_pending", "payments", ["created_at"],
+            postgresql_where=sa.text("status = 'pending'"),
+            postgresql_concurrently=True, if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index("ix_payments_pending", table_name="payments", postgresql_concurrently=True, if_exists=True)
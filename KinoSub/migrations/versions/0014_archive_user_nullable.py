@@ -0,0 +1,26 @@
+"""notifications_archive.user_id допускает NULL
+
+Revision ID: 0014_archive_user_nullable
+Revises: 0013_payments_pending_index
+Create Date: 2026-10-18
+
+В notifications user_id nullable: одно уведомление без пользователя
+роняло INSERT ... SELECT всей пачки архивации, и перенос вставал.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = "0014_archive_user_nullable"
+down_revision: Union[str, None] = "0013_payments_pending_index"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.alter_column("notifications_archive", "user_id", nullable=True)
+
+
+def downgrade() -> None:
+    op.execute("DELETE FROM notifications_archive WHERE user_id IS NULL")
+    op.alter_column("notifications_archive", "user_id", nullable=False)
@@ -0,0 +1,41 @@
+"""Версия каталога — строка вместо последовательности
+
+Revision ID: 0015_catalog_version_row
+Revises: 0014_archive_user_nullable
+Create Date: 2026-10-18
+
+Последовательность не транзакционна: nextval незакоммиченного изменения
+уже виден читателям, и снимок со старыми строками мог закэшироваться под
+новой версией. Строка catalog_version меняется в транзакции изменения и
+читается в одном снимке со строками каталога.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "0015_catalog_version_row"
+down_revision: Union[str, None] = "0014_archive_user_nullable"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "catalog_version",
+        sa.Column("id", sa.Integer(), primary_key=True, autoincrement=False),
+        sa.Column("version", sa.BigInteger(), nullable=False),
+    )
+    op.execute(
+        "INSERT INTO catalog_version (id, version) "
+        "SELECT 1, CASE WHEN is_called THEN last_value ELSE 0 END FROM catalog_version_seq"
+    )
+    op.execute(sa.schema.DropSequence(sa.Sequence("catalog_version_seq")))
+
+
+def downgrade() -> None:
+    op.execute(sa.schema.CreateSequence(sa.Sequence("catalog_version_seq")))
+    op.execute(
+        "SELECT setval('catalog_version_seq', version, true) FROM catalog_version WHERE version > 0"
+    )
+    op.drop_table("catalog_version")
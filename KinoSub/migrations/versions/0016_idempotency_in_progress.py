@@ -0,0 +1,29 @@
+"""Ключ идемпотентности «в работе»
+
+Revision ID: 0016_idempotency_in_progress
+Revises: 0015_catalog_version_row
+Create Date: 2026-10-18
+
+Оплата через провайдера занимает Idempotency-Key в одной транзакции
+с pending-платежом, ещё до списания; ответа в этот момент нет, поэтому
+status_code и response допускают NULL.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = "0016_idempotency_in_progress"
+down_revision: Union[str, None] = "0015_catalog_version_row"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.alter_column("idempotency_keys", "status_code", nullable=True)
+    op.alter_column("idempotency_keys", "response", nullable=True)
+
+
+def downgrade() -> None:
+    op.execute("DELETE FROM idempotency_keys WHERE status_code IS NULL")
+    op.alter_column("idempotency_keys", "response", nullable=False)
+    op.alter_column("idempotency_keys", "status_code", nullable=False)
@@ -0,0 +1,27 @@
+"""Id операции у провайдера — отдельной колонкой
+
+Revision ID: 0017_payment_provider_txn
+Revises: 0016_idempotency_in_progress
+Create Date: 2026-10-18
+
+external_id — ссылка, которую мы передаём провайдеру как ключ
+идемпотентности; сверка ищет платёж по ней. Id операции провайдера
+раньше затирал её при завершении платежа.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "0017_payment_provider_txn"
+down_revision: Union[str, None] = "0016_idempotency_in_progress"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("payments", sa.Column("provider_transaction_id", sa.String(100), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("payments", "provider_transaction_id")
@@ -0,0 +1,17 @@
+"""
+Общие настройки тестов.
+
+Переменные окружения выставляются до первого импорта app.config:
+настройки читаются один раз при импорте. Фоновые задачи и LISTEN в тестах
+не запускаются, счётчик SQL-запросов падает при превышении бюджета.
+
+Тесты, которым нужен Postgres, берут адрес из TEST_DATABASE_URL (база
+пересоздаётся — только одноразовая!) и пропускаются, если он не задан
+"""
+import os
+
+os.environ.setdefault("SCHEDULER_ENABLED", "false")
+os.environ.setdefault("NOTIFICATION_STREAM_ENABLED", "false")
+os.environ.setdefault("QUERY_BUDGET_MODE", "raise")
+if os.environ.get("TEST_DATABASE_URL"):
+    os.environ["DATABASE_URL"] = os.environ["TEST_DATABASE_URL"]
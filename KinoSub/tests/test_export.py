@@ -0,0 +1,76 @@
+import csv
+import gzip
+import io
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import create_engine, insert
+
+from app.models import BalanceTransaction, Payment, TransactionType
+from app.services import export
+from app.services.export import export_query, stream_export
+
+
+@pytest.fixture
+def engine(monkeypatch):
+    # stream_export читает через app.database.engine; для теста хватает SQLite
+    engine = create_engine("sqlite://")
+    Payment.__table__.create(engine)
+    BalanceTransaction.__table__.create(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(Payment), [
+            {
+                "id": i, "user_id": 1 + i % 2, "subscription_id": 1, "amount": Decimal("9.90"),
+                "status": "completed", "payment_method": "card", "external_id": f"ext_{i}",
+                "created_at": datetime(2026, 10, i), "is_refunded": False, "refund_reason": None,
+            }
+            for i in range(1, 8)
+        ])
+        conn.execute(insert(BalanceTransaction), [{
+            "id": 1, "user_id": 1, "amount": Decimal("5.00"), "type": TransactionType.topup,
+            "description": "Пополнение, \"с кавычками\"", "created_at": datetime(2026, 10, 1),
+        }])
+    monkeypatch.setattr(export, "engine", engine)
+    yield engine
+    engine.dispose()
+
+
+def read(chunks) -> str:
+    return b"".join(chunks).decode("utf-8")
+
+
+def test_csv_header_rows_and_batches(engine):
+    chunks = list(stream_export(export_query("payments"), "csv", batch_size=3))
+    rows = list(csv.reader(io.StringIO(read(chunks))))
+
+    assert rows[0] == list(export.EXPORTS["payments"][1])
+    assert [row[0] for row in rows[1:]] == [str(i) for i in range(1, 8)]
+    assert rows[1][3] == "9.90" and rows[1][7] == "2026-10-01T00:00:00"
+    assert len(chunks) == 1 + 3  # заголовок + пачки по 3 строки
+
+
+def test_ndjson_with_filters(engine):
+    query = export_query("payments", date_from=date(2026, 10, 2), date_to=date(2026, 10, 5), user_id=1)
+    lines = read(stream_export(query, "ndjson")).splitlines()
+
+    assert [json.loads(line)["id"] for line in lines] == [2, 4]  # date_to включительно
+
+
+def test_enum_and_quoting(engine):
+    rows = list(csv.reader(io.StringIO(read(stream_export(export_query("balance-transactions"), "csv")))))
+    assert rows[1][3] == "topup"
+    assert rows[1][4] == "Пополнение, \"с кавычками\""
+
+
+def test_gzip_stream_is_valid_gzip(engine):
+    plain = read(stream_export(export_query("payments"), "ndjson"))
+    compressed = b"".join(stream_export(export_query("payments"), "ndjson", gzip=True, batch_size=2))
+
+    assert gzip.decompress(compressed).decode("utf-8") == plain
+
+
+def test_unknown_format(engine):
+    with pytest.raises(ValueError):
+        list(stream_export(export_query("payments"), "xml"))
@@ -0,0 +1,82 @@
+"""
+Списки под счётчиком SQL-запросов (QUERY_BUDGET_MODE=raise, см. conftest):
+N+1 в любом из них роняет тест исключением QueryBudgetExceeded.
+Нужен Postgres: TEST_DATABASE_URL
+"""
+import os
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlalchemy import text
+
+pytestmark = pytest.mark.skipif(not os.environ.get("TEST_DATABASE_URL"), reason="нужен TEST_DATABASE_URL")
+
+ROWS = 5  # больше бюджета маршрута: N+1 обязательно его превысит
+
+
+@pytest.fixture(scope="module")
+def client():
+    from fastapi.testclient import TestClient
+
+    from app.config import settings
+    from app.database import Base, SessionLocal, engine
+    from app.main import app
+    from app.models import (
+        BalanceTransaction, Notification, Payment, Subscription, SubscriptionRequest, User, UserSubscription,
+    )
+    from app.routers.auth import create_access_token
+
+    assert settings.query_budget_mode == "raise"
+    with engine.begin() as conn:
+        conn.execute(text("DROP SCHEMA public CASCADE; CREATE SCHEMA public"))
+    Base.metadata.create_all(engine)
+
+    db = SessionLocal()
+    admin = User(username="admin", email="admin@example.com", password_hash="-", role="admin", balance=0)
+    users = [User(username=f"user{i}", email=f"user{i}@example.com", password_hash="-", balance=100) for i in range(ROWS)]
+    subscriptions = [Subscription(name=f"S{i}", price=10, duration_days=30) for i in range(ROWS)]
+    db.add_all([admin, *users, *subscriptions])
+    db.flush()
+
+    user = users[0]
+    now = datetime.utcnow()
+    for i, subscription in enumerate(subscriptions):
+        db.add(UserSubscription(
+            user_id=user.id, subscription_id=subscription.id,
+            start_date=date.today(), end_date=date.today() + timedelta(days=30),
+        ))
+        db.add(Payment(
+            user_id=user.id, subscription_id=subscription.id, amount=10, status="completed",
+            payment_method="balance", external_id=f"test_{i}", created_at=now,
+        ))
+        db.add(BalanceTransaction(user_id=user.id, amount=10, type="withdraw", created_at=now))
+        db.add(Notification(user_id=user.id, message=f"m{i}", created_at=now))
+        db.add(SubscriptionRequest(user_id=users[i].id, subscription_id=subscription.id, created_at=now))
+    db.commit()
+    tokens = {
+        "user": create_access_token({"sub": str(user.id)}),
+        "admin": create_access_token({"sub": str(admin.id)}),
+    }
+    db.close()
+
+    with TestClient(app) as client:
+        client.tokens = tokens
+        yield client
+
+
+@pytest.mark.parametrize("path, role", [
+    ("/user-subscriptions/me", "user"),
+    ("/notifications/", "user"),
+    ("/payments/", "user"),
+    ("/wallet/history", "user"),
+    ("/users/", "admin"),
+    ("/subscription-requests/admin", "admin"),
+    ("/subscription-requests/admin?status=pending", "admin"),
+])
+def test_list_route_within_query_budget(client, path, role):
+    response = client.get(path, headers={"Authorization": f"Bearer {client.tokens[role]}"})
+    assert response.status_code == 200, response.text
+
+    body = response.json()
+    items = body if isinstance(body, list) else body["items"]
+    assert len(items) >= ROWS
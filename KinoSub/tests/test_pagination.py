@@ -0,0 +1,47 @@
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql
+
+from app.models import Notification, User
+from app.services.pagination import Keyset
+
+keyset = Keyset(Notification.created_at, Notification.id)
+
+
+def test_cursor_round_trip():
+    row = SimpleNamespace(created_at=datetime(2026, 10, 18, 12, 30, 15, 123456), id=42)
+    assert keyset.decode(keyset.encode(row)) == [row.created_at, 42]
+
+
+@pytest.mark.parametrize("cursor", ["zzz", "bnVsbA==", "WzFd", "W251bGwsIDFd"])
+def test_bad_cursor_is_400(cursor):
+    # мусор, null, не то число значений, null вместо даты
+    with pytest.raises(HTTPException) as error:
+        keyset.decode(cursor)
+    assert error.value.status_code == 400
+
+
+def test_page_returns_cursor_only_when_more_rows():
+    rows = [SimpleNamespace(created_at=datetime(2026, 1, day), id=day) for day in (3, 2, 1)]
+
+    page = keyset.page(rows, limit=2)
+    assert [row.id for row in page["items"]] == [3, 2]
+    assert keyset.decode(page["next_cursor"]) == [datetime(2026, 1, 2), 2]
+
+    assert keyset.page(rows, limit=3)["next_cursor"] is None
+
+
+def test_apply_descending_and_ascending():
+    cursor = keyset.encode(SimpleNamespace(created_at=datetime(2026, 1, 1), id=7))
+    sql = str(keyset.apply(select(Notification), cursor, 10).compile(dialect=postgresql.dialect()))
+    assert "(notifications.created_at, notifications.id) < (" in sql
+    assert "ORDER BY notifications.created_at DESC, notifications.id DESC" in sql
+
+    users = Keyset(User.id, descending=False)
+    sql = str(users.apply(select(User), users.encode(SimpleNamespace(id=5)), 10).compile(dialect=postgresql.dialect()))
+    assert "(users.id) > (" in sql
+    assert "ORDER BY users.id ASC" in sql
@@ -0,0 +1,67 @@
+from datetime import date, timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+
+import pytest
+from pydantic import ValidationError
+
+from app.schemas import SubscriptionCreate, SubscriptionUpdate
+from app.services.pricing import PriceTable, effective_price
+
+TODAY = date(2026, 10, 18)
+
+
+def subscription(id=1, price="100.00", rate=None, until=None):
+    return SimpleNamespace(
+        id=id,
+        price=Decimal(price),
+        discount_rate=Decimal(rate) if rate is not None else None,
+        discount_until=until,
+    )
+
+
+def test_effective_price_discount_and_rounding():
+    assert effective_price(subscription(), TODAY) == Decimal("100.00")
+    assert effective_price(subscription(rate="0.25", until=TODAY), TODAY) == Decimal("75.00")
+    # скидка заканчивается после discount_until
+    assert effective_price(subscription(rate="0.25", until=TODAY), TODAY + timedelta(days=1)) == Decimal("100.00")
+    # без discount_until скидка бессрочная; округление половины вверх
+    assert effective_price(subscription(price="0.99", rate="0.50"), TODAY) == Decimal("0.50")
+
+
+def test_effective_price_never_negative():
+    # старые строки со скидкой вне [0, 1)
+    assert effective_price(subscription(rate="1.50"), TODAY) == Decimal("0.00")
+    assert effective_price(subscription(rate="-0.50"), TODAY) == Decimal("100.00")
+
+
+def test_price_table_matches_effective_price():
+    subscriptions = [
+        subscription(1),
+        subscription(2, rate="0.10", until=TODAY + timedelta(days=3)),
+        subscription(3, rate="0.20"),
+        subscription(4, rate="0.30", until=TODAY - timedelta(days=1)),
+    ]
+    table = PriceTable(subscriptions, TODAY, days=7)
+
+    for item in subscriptions:
+        for offset in range(-2, 10):  # и за пределами заранее посчитанных дней
+            day = TODAY + timedelta(days=offset)
+            assert table.price(item.id, day) == effective_price(item, day), (item.id, offset)
+
+
+def test_price_table_batch_lookup():
+    table = PriceTable([subscription(1), subscription(2, price="50.00")], TODAY, days=7)
+
+    assert table.price(99, TODAY) is None
+    assert table.prices([1, 2, 2, 99], TODAY) == {1: Decimal("100.00"), 2: Decimal("50.00")}
+
+
+@pytest.mark.parametrize("rate", [1, 1.5, -0.1])
+def test_discount_rate_out_of_range_is_rejected(rate):
+    with pytest.raises(ValidationError):
+        SubscriptionCreate(name="s", price=100, duration_days=30, discount_rate=rate)
+    with pytest.raises(ValidationError):
+        SubscriptionUpdate(discount_rate=rate)
+
+    assert SubscriptionUpdate(discount_rate=0.99).discount_rate == 0.99
@@ -0,0 +1,71 @@
+import logging
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event, text
+
+from app.services.query_budget import QueryBudgetExceeded, QueryBudgetMiddleware, _before_cursor_execute
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite://")
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    yield engine
+    engine.dispose()
+
+
+def make_app(engine, mode: str) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/items/{count}")
+    def items(count: int):
+        with engine.connect() as conn:
+            for _ in range(count):
+                conn.execute(text("SELECT 1"))
+        return {"queries": count}
+
+    @app.get("/bulk")
+    def bulk():
+        with engine.connect() as conn:
+            for _ in range(10):
+                conn.execute(text("SELECT 2"))
+        return {}
+
+    app.add_middleware(
+        QueryBudgetMiddleware, mode=mode, default_budget=3, budgets={"GET /bulk": None},
+    )
+    return app
+
+
+def test_within_budget(engine):
+    client = TestClient(make_app(engine, "raise"))
+    assert client.get("/items/3").status_code == 200
+
+
+def test_over_budget_raises_with_most_repeated_statement(engine):
+    client = TestClient(make_app(engine, "raise"))
+    with pytest.raises(QueryBudgetExceeded) as error:
+        client.get("/items/4")
+    assert "GET /items/{count}: 4 SQL-запросов при бюджете 3" in str(error.value)
+    assert "(4 раз): SELECT 1" in str(error.value)
+
+
+def test_warn_mode_logs_and_answers(engine, caplog):
+    client = TestClient(make_app(engine, "warn"))
+    with caplog.at_level(logging.WARNING, logger="app.services.query_budget"):
+        assert client.get("/items/5").status_code == 200
+    assert "5 SQL-запросов при бюджете 3" in caplog.text
+
+
+def test_route_without_budget_is_not_checked(engine):
+    client = TestClient(make_app(engine, "raise"))
+    assert client.get("/bulk").status_code == 200
+
+
+def test_queries_outside_requests_are_not_counted(engine):
+    # счётчик привязан к HTTP-запросу: фоновая работа вне запроса не падает
+    with engine.connect() as conn:
+        for _ in range(10):
+            conn.execute(text("SELECT 1"))
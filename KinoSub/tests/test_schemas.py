@@ -0,0 +1,38 @@
+from datetime import datetime
+
+import pytest
+from pydantic import ValidationError
+
+from app.schemas import NotificationsRead, SubscriptionRequestsBulk
+
+
+def test_bulk_needs_exactly_one_of_ids_or_filter():
+    assert SubscriptionRequestsBulk(action="approve", ids=[1, 2]).ids == [1, 2]
+    assert SubscriptionRequestsBulk(action="reject", filter={}).filter.subscription_id is None
+
+    for payload in ({}, {"ids": [1], "filter": {}}):
+        with pytest.raises(ValidationError, match="Нужно передать ids или filter"):
+            SubscriptionRequestsBulk(action="approve", **payload)
+
+
+@pytest.mark.parametrize("payload", [
+    {"action": "delete", "ids": [1]},
+    {"action": "approve", "ids": []},
+    {"action": "approve", "ids": list(range(10001))},
+])
+def test_bulk_rejects_bad_action_and_id_lists(payload):
+    with pytest.raises(ValidationError):
+        SubscriptionRequestsBulk(**payload)
+
+
+@pytest.mark.parametrize("value", [
+    "2026-10-18T10:00:00.000Z",  # new Date().toISOString()
+    "2026-10-18T13:00:00+03:00",
+    "2026-10-18T10:00:00",  # без пояса — уже UTC
+])
+def test_client_datetimes_become_naive_utc(value):
+    expected = datetime(2026, 10, 18, 10, 0)
+
+    bulk = SubscriptionRequestsBulk(action="approve", filter={"created_before": value})
+    assert bulk.filter.created_before == expected
+    assert NotificationsRead(before=value).before == expected